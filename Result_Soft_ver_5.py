@@ -1,51 +1,23 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
-import re
-import pandas as pd
+from tkinter import filedialog, messagebox, ttk
 import os
+import queue
 import sys
-from openpyxl import load_workbook
-from openpyxl.styles import Font
+import threading
+from multiprocessing import freeze_support
 
-# -------------------------
-# Subject header maps
-# -------------------------
-GRADE10_SUBJECT_HEADER_MAP = {
-    "184": "ENG-184",
-    "085": "HND-085",
-    "122": "SNK-122",
-    "041": "MAT-041",
-    "241": "MAT-241",
-    "086": "SCI-086",
-    "087": "SST-087",
-    "402": "IT-402"
-}
-
-GRADE12_SUBJECT_HEADER_MAP = {
-    "301": "ENG-301",
-    "042": "PHY-042",
-    "043": "CHE-043",
-    "044": "BIO-044",
-    "041": "MAT-041",
-    "055": "ACC-055",
-    "054": "BST-054",
-    "030": "ECO-030",
-    "048": "PHED-048",
-    "065": "IP-065",
-    "027": "HIS-027",
-    "028": "POL_SC-028",
-    "029": "GEO-029",
-    "049": "PAINT-049"
-}
+from result_batch import run_batch
+from result_cache import open_parse_cache
+from result_core import (CATALOG_ERROR, COMMON_CODES, GRADE_CODES, SNIFF_BYTES, SUBJECT_CODE_RE, Cancelled,
+                         classify_gazette, convert_gazette, output_format, warm_imports)
 
-# -------------------------
-# Main subject sets
-# -------------------------
-MAIN_SUBJECTS_10 = {"MAT-041", "MAT-241", "SCI-086", "SST-087", "ENG-184", "HND-085", "SNK-122"}
-MAIN_SUBJECTS_12_PCM = {"ENG-301", "PHY-042", "CHE-043", "MAT-041", "PHED-048", "IP-065"}
-MAIN_SUBJECTS_12_PCB = {"ENG-301", "PHY-042", "CHE-043", "BIO-044", "PHED-048", "IP-065"}
-MAIN_SUBJECTS_12_COM = {"ENG-301", "ECO-030", "BST-054", "ACC-055", "PHED-048", "IP-065"}
-MAIN_SUBJECTS_12_ARTS = {"ENG-301", "HIS-027", "POL_SC-028", "GEO-029", "PAINT-049", "IP-065"}
+# Save dialog choices; Parquet/Feather need pyarrow installed
+OUTPUT_FILETYPES = [
+    ("Excel Files", "*.xlsx"),
+    ("CSV Files", "*.csv"),
+    ("Parquet Files", "*.parquet"),
+    ("Feather / Arrow Files", "*.feather *.arrow"),
+]
 
 
 # -------------------------
@@ -55,9 +27,9 @@ class CBSEParserApp(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("CBSE Result Soft 1.4 - Launcher")
-        self.geometry("520x240")
+        self.geometry("520x300")
         self.resizable(False, False)
-        self.center_window(520, 240)
+        self.center_window(520, 300)
         self.protocol("WM_DELETE_WINDOW", self.init_final_frame)
 
         tk.Label(self, text="Choose program version", font=("Arial", 16)).pack(pady=12)
@@ -65,6 +37,7 @@ class CBSEParserApp(tk.Tk):
                   command=lambda: self.open_parser(False)).pack(pady=8)
         tk.Button(self, text="Grade 12 Program", width=22, height=2, bg="lightgreen",
                   command=lambda: self.open_parser(True)).pack(pady=8)
+        tk.Button(self, text="Batch (whole folder)", width=22, bg="khaki", command=self.open_batch).pack(pady=4)
         tk.Button(self, text="Exit", width=10,height=2, bg="red", command=self.init_final_frame).pack(pady=10)
 
         # Try to load app icon
@@ -79,6 +52,15 @@ class CBSEParserApp(tk.Tk):
         except Exception:
             pass
 
+        # A broken subjects.json falls back to the built-in subjects; say so once the launcher is up
+        if CATALOG_ERROR:
+            self.after(200, lambda: messagebox.showwarning(
+                "Subject catalog", f"The subject catalog could not be read, so the built-in subjects are used.\n\n"
+                                   f"{CATALOG_ERROR}"))
+
+        # pandas/openpyxl load lazily; start loading them once the launcher is on screen
+        self.after(300, lambda: threading.Thread(target=warm_imports, daemon=True).start())
+
     def center_window(self, w, h):
         sw, sh = self.winfo_screenwidth(), self.winfo_screenheight()
         x, y = (sw - w) // 2, (sh - h) // 2
@@ -88,6 +70,10 @@ class CBSEParserApp(tk.Tk):
         self.withdraw()
         parser = ParserWindow(self, is_grade12)
         parser.grab_set()
+
+    def open_batch(self):
+        self.withdraw()
+        BatchWindow(self).grab_set()
     
     # ✅ Add this inside the launcher
     def init_final_frame(self):
@@ -122,6 +108,9 @@ class ParserWindow(tk.Toplevel):
 
         self.file_path = None
         self.sample_line = ""
+        self.first_record = None
+        self.cancel_event = threading.Event()
+        self.poll_id = None
 
         self.init_frame1()
 
@@ -139,6 +128,9 @@ class ParserWindow(tk.Toplevel):
         
     def on_close(self):
         """Triggered when user clicks window close (X) button."""
+        self.cancel_event.set()     # Stop a running export
+        if self.poll_id:
+            self.after_cancel(self.poll_id)
         try:
             self.destroy()          # Fully destroy this parser window
             self.master.deiconify() # Restore launcher window
@@ -167,7 +159,7 @@ class ParserWindow(tk.Toplevel):
         self.file_label = tk.Label(btn_frame, text="No file selected", font=("Arial", 10))
         self.file_label.pack(side="left")
 
-        tk.Label(self.frame1, text="Step 2: Paste Sample Student Line", font=("Arial", 12)).pack(pady=8)
+        tk.Label(self.frame1, text="Step 2 (optional): Paste Sample Student Line", font=("Arial", 12)).pack(pady=8)
         self.sample_entry = tk.Text(self.frame1, height=6, width=80)
         self.sample_entry.pack()
 
@@ -185,217 +177,185 @@ class ParserWindow(tk.Toplevel):
         path = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt")])
         if path:
             self.file_path = path
+            self.first_record = None
             self.file_label.config(text=os.path.basename(path))
 
     def validate_sample(self):
         self.sample_line = self.sample_entry.get("1.0", tk.END).strip()
-        if not self.file_path or not self.sample_line:
-            messagebox.showerror("Error", "Please select a file and enter a sample line.")
+        if not self.file_path:
+            messagebox.showerror("Error", "Please select a file.")
             return
 
-        # Determine selected grade
-        if self.grade12:
-            valid_codes = set(GRADE12_SUBJECT_HEADER_MAP.keys())
-            other_codes = set(GRADE10_SUBJECT_HEADER_MAP.keys())
-            grade_text = "Grade 12"
-        else:
-            valid_codes = set(GRADE10_SUBJECT_HEADER_MAP.keys())
-            other_codes = set(GRADE12_SUBJECT_HEADER_MAP.keys())
-            grade_text = "Grade 10"
-
-        # Common codes (e.g., 041 appears in both)
-        common_codes = set(GRADE10_SUBJECT_HEADER_MAP.keys()) & set(GRADE12_SUBJECT_HEADER_MAP.keys())
-
-        # --- Read only the first student line ---
-        with open(self.file_path, "r", encoding="utf-8", errors="ignore") as f:
-            first_line = ""
-            for line in f:
-                if re.match(r"^\d{8}\s", line.strip()):
-                    first_line = line.strip()
-                    break
-
-        if not first_line:
-            messagebox.showerror("Error", "No valid student record found in the file.")
-            return
-
-        found_codes_in_file = set(re.findall(r"\b\d{3}\b", first_line))
-        found_codes_in_sample = set(re.findall(r"\b\d{3}\b", self.sample_line))
+        # Determine selected grade (code sets are built once in result_core)
+        valid_codes = GRADE_CODES[self.grade12]
+        other_codes = GRADE_CODES[not self.grade12]
+        grade_text = "Grade 12" if self.grade12 else "Grade 10"
 
-        # Ignore common codes when checking for wrong ones
-        wrong_in_file = (found_codes_in_file & other_codes) - common_codes
-        wrong_in_sample = (found_codes_in_sample & other_codes) - common_codes
+        # --- Classify the file from its first students (bounded read, any file size) ---
+        info = classify_gazette(self.file_path)
+        if info is None:
+            messagebox.showerror("Error", f"No valid student record found in the first {SNIFF_BYTES // 1024} KB "
+                                          "of the file.")
+            return
+        self.first_record = info.first
 
-        found_expected_in_file = bool(found_codes_in_file & valid_codes)
+        # The sample line is optional; when given it is still cross-checked
+        found_codes_in_sample = set(SUBJECT_CODE_RE.findall(self.sample_line))
+        # Ignore common codes (e.g., 041 appears in both) when checking for wrong ones
+        wrong_in_sample = (found_codes_in_sample & other_codes) - COMMON_CODES
         found_expected_in_sample = bool(found_codes_in_sample & valid_codes)
 
         # --- Validation ---
-        if not (found_expected_in_file and found_expected_in_sample) or wrong_in_file or wrong_in_sample:
+        file_ok = info.is_grade12 == self.grade12 and info.confident
+        sample_ok = not self.sample_line or (found_expected_in_sample and not wrong_in_sample)
+        if not (file_ok and sample_ok):
             msg = f"Please upload the correct file and sample for {grade_text}.\n\n"
-            if wrong_in_file:
-                msg += f"❌ Wrong subject codes in first student record: {', '.join(sorted(wrong_in_file))}\n"
+            if info.is_grade12 is None:
+                msg += f"⚠️ No valid subject codes found in the first {info.records} student records.\n"
+            elif not file_ok:
+                msg += (f"❌ The file looks like a {info.grade_text} result "
+                        f"({info.confidence:.0%} of the first {info.records} student records).\n")
             if wrong_in_sample:
                 msg += f"❌ Wrong subject codes in sample text: {', '.join(sorted(wrong_in_sample))}\n"
-            if not found_expected_in_file:
-                msg += "⚠️ No valid subject codes found in first student record.\n"
-            if not found_expected_in_sample:
+            if self.sample_line and not found_expected_in_sample:
                 msg += "⚠️ No valid subject codes found in sample text.\n"
             messagebox.showerror("Invalid File or Sample", msg)
             return
 
-        messagebox.showinfo("Success", f"✅ File and sample text validated successfully for {grade_text}.")
+        stream_text = {None: "", "MIXED": " (mixed streams)"}.get(info.stream, f" ({info.stream} stream)")
+        messagebox.showinfo("Success", f"✅ File validated successfully for {grade_text}{stream_text}.")
         self.goto_next_frame()
 
-
     def goto_next_frame(self):
         self.frame1.destroy()
         self.init_frame2()
 
     # -------------------------
-    # Frame 2: Save Excel
+    # Frame 2: Save output
     # -------------------------
     def init_frame2(self):
         self.frame2 = tk.Frame(self)
         self.frame2.pack(fill="both", expand=True, padx=12, pady=12)
-        tk.Label(self.frame2, text="Step 3: Save Excel Output", font=("Arial", 14)).pack(pady=24)
-        tk.Button(self.frame2, text="Save and Generate Excel", command=self.generate_excel,
-                  font=("Tahoma", 12), width=28, bd=0, bg="lightblue").pack(pady=8)
-        tk.Button(self.frame2, text="Back", command=self.back_to_step1, width=12).pack(pady=6)
+        tk.Label(self.frame2, text="Step 3: Save Output", font=("Arial", 14)).pack(pady=24)
+        self.save_button = tk.Button(self.frame2, text="Save and Generate", command=self.generate_excel,
+                                     font=("Tahoma", 12), width=28, bd=0, bg="lightblue")
+        self.save_button.pack(pady=8)
+        self.grades_var = tk.BooleanVar(self.frame2, value=getattr(self, "grade_columns", False))
+        tk.Checkbutton(self.frame2, text="Include subject grade columns (A1..E)",
+                       variable=self.grades_var).pack()
+        self.back_button = tk.Button(self.frame2, text="Back", command=self.back_to_step1, width=12)
+        self.back_button.pack(pady=6)
+
+        # Progress widgets, shown while an export runs
+        self.progress_bar = ttk.Progressbar(self.frame2, length=420, maximum=100)
+        self.status_label = tk.Label(self.frame2, text="", font=("Arial", 10))
+        self.cancel_button = tk.Button(self.frame2, text="Cancel", command=self.cancel_export,
+                                       width=12, bg="orange")
 
     def back_to_step1(self):
         self.frame2.destroy()
         self.init_frame1()
 
     # -------------------------
-    # Excel generation
+    # Export (Excel, CSV, Parquet or Feather)
     # -------------------------
     def generate_excel(self):
-        file_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Files", "*.xlsx")])
+        file_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=OUTPUT_FILETYPES)
         if not file_path:
             return
         try:
-            self.parse_and_save(file_path)
-            response = messagebox.askyesno("Success", f"✅ File saved:\n{file_path}\n\nGenerate another file?")
+            self.format_name = output_format(file_path)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.grade_columns = self.grades_var.get()  # read here, the worker thread must not touch Tk
+
+        self.save_button.config(state="disabled")
+        self.back_button.config(state="disabled")
+        self.progress_bar["value"] = 0
+        self.progress_bar.pack(pady=8)
+        self.status_label.config(text="Starting...")
+        self.status_label.pack()
+        self.cancel_button.config(state="normal")
+        self.cancel_button.pack(pady=8)
+
+        # The export runs in a worker thread; it only talks to the UI through this queue
+        self.events = queue.Queue()
+        self.read_text = "Reading file..."
+        self.cancel_event.clear()
+        threading.Thread(target=self.export_worker, args=(file_path,), daemon=True).start()
+        self.poll_id = self.after(100, self.poll_export, file_path)
+
+    def export_worker(self, file_path):
+        """Background thread: parse and save, posting progress events to self.events."""
+        def progress(stage, done, total):
+            if self.cancel_event.is_set():
+                raise Cancelled()
+            self.events.put((stage, done, total))
+
+        try:
+            df = self.parse_and_save(file_path, progress)
+            self.events.put(("done", df.attrs.get("issues", 0), None))
+        except Cancelled:
+            self.events.put(("cancelled", None, None))
+        except Exception as e:
+            self.events.put(("error", str(e), None))
+
+    def poll_export(self, file_path):
+        """Apply queued progress events on the Tk thread (scheduled with after())."""
+        self.poll_id = None
+        while True:
+            try:
+                stage, done, total = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if stage == "read":
+                # Reading/parsing is the first 70% of the bar, writing the rest
+                self.progress_bar["value"] = 70 * done / max(total, 1)
+                self.read_text = f"Reading file... {done / 1e6:.1f} of {total / 1e6:.1f} MB"
+            elif stage == "parsed":
+                self.status_label.config(text=f"{self.read_text} | {done:,} records")
+            elif stage == "written":
+                self.progress_bar["value"] = 70 + 30 * done / max(total, 1)
+                self.status_label.config(text=f"Writing {self.format_name}... {done:,} of {total:,} rows")
+            else:
+                self.finish_export(file_path, stage, done)
+                return
+        self.poll_id = self.after(100, self.poll_export, file_path)
+
+    def cancel_export(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state="disabled")
+        self.status_label.config(text="Cancelling...")
+
+    def finish_export(self, file_path, stage, detail):
+        """detail is the message for stage "error" and the issue count for "done"."""
+        if stage == "error":
+            messagebox.showerror("Error", detail)
+        elif stage == "cancelled":
+            messagebox.showinfo("Cancelled", f"{self.format_name} export was cancelled.")
+        else:
+            issues = f"\n\n⚠ {detail:,} issues found, see the Issues sheet." if detail else ""
+            response = messagebox.askyesno("Success",
+                                           f"✅ File saved:\n{file_path}{issues}\n\nGenerate another file?")
+            self.frame2.destroy()
             if response:
-                self.frame2.destroy()
                 self.init_frame1()
             else:
-                self.frame2.destroy()
                 self.init_final_frame()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+            return
+
+        # Error or cancel: back to the save button
+        self.frame2.destroy()
+        self.init_frame2()
 
     # -------------------------
     # Parser Logic
     # -------------------------
-    def parse_and_save(self, filename):
-        with open(self.file_path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = [ln.strip() for ln in f if ln.strip()]
-
-        data = []
-        i = 0
-        while i < len(lines) - 1:
-            line1 = lines[i]
-            line2 = lines[i + 1] if i + 1 < len(lines) else ""
-
-            if not re.match(r"^\d{8}\s", line1):
-                i += 1
-                continue
-
-            m = re.match(r"^(\d{8})\s+([MF])\s+(.*?)\s+(\d{3})", line1)
-            if not m:
-                i += 1
-                continue
-
-            roll, gender, name = m.group(1), m.group(2), m.group(3).strip()
-            codes = re.findall(r"\b\d{3}\b", line1)
-            marks = [int(m) for m in re.findall(r"(\d{1,3})\s+[A-D][12]", line2)]
-
-            header_map = GRADE12_SUBJECT_HEADER_MAP if self.grade12 else GRADE10_SUBJECT_HEADER_MAP
-            row = {"Roll No": roll, "Gender": gender, "Name": name}
-
-            for j in range(min(len(codes), len(marks))):
-                code = codes[j]
-                label = header_map.get(code, f"SUB-{code}")
-                row[label] = marks[j]
-
-            result = re.search(r"\b(PASS|FAIL|COMP|ABST)\b", line1 + " " + line2, re.I)
-            row["Result"] = result.group(1).upper() if result else ""
-
-            # Calculate totals
-            if self.grade12:
-                vals = [v for k, v in row.items() if k in GRADE12_SUBJECT_HEADER_MAP.values()]
-                total = sum(vals)
-                row["Total"] = total
-                row["Percentage"] = round(total / len(vals), 2) if vals else 0
-            else:
-                vals = [v for k, v in row.items() if k in GRADE10_SUBJECT_HEADER_MAP.values()]
-                main_scores = [v for k, v in row.items() if k in MAIN_SUBJECTS_10]
-                top5 = sorted(vals, reverse=True)[:5]
-                row["Main Total"] = sum(main_scores)
-                row["Main %"] = round(sum(main_scores) / len(main_scores), 2) if main_scores else 0
-                row["Top 5 Total"] = sum(top5)
-                row["Top 5 %"] = round(sum(top5) / 5, 2) if top5 else 0
-
-            data.append(row)
-            i += 2
-
-        df = pd.DataFrame(data)
-
-        if self.grade12:
-            if "Percentage" in df.columns:
-                df["Rank"] = df["Percentage"].rank(method="dense", ascending=False).astype(int)
-        else:
-            if "Main %" in df.columns:
-                df["Main % Rank"] = df["Main %"].rank(method="dense", ascending=False).astype(int)
-            if "Top 5 %" in df.columns:
-                df["Top 5 % Rank"] = df["Top 5 %"].rank(method="dense", ascending=False).astype(int)
-
-                # ✅ Reorder columns properly before saving
-        if self.grade12:
-            final_cols = [
-                "Roll No", "Gender", "Name",
-                "ENG-301", "PHY-042", "CHE-043", "MAT-041", "BIO-044",
-                "ECO-030", "BST-054", "ACC-055", "HIS-027", "POL_SC-028",
-                "GEO-029", "PAINT-049", "PHED-048", "IP-065",
-                "Result", "Total", "Percentage", "Rank"
-            ]
-        else:
-            final_cols = [
-                "Roll No", "Gender", "Name",
-                "ENG-184", "HND-085", "IT-402", "MAT-041", "MAT-241",
-                "SCI-086", "SNK-122", "SST-087",
-                "Result", "Main Total", "Main %", "Main % Rank",
-                "Top 5 Total", "Top 5 %", "Top 5 % Rank"
-            ]
-
-        # Keep only columns that exist
-        df = df.reindex(columns=[c for c in final_cols if c in df.columns])
-
-        df.to_excel(filename, index=False)
-
-
-        # ✅ Summary Sheet
-        ordered_mark_cols = [col for col in df.columns if "-" in col and df[col].dtype != "object"]
-        if ordered_mark_cols:
-            wb = load_workbook(filename)
-            ws_summary = wb.create_sheet(title="Summary")
-
-            summary = {
-                "Subject": ordered_mark_cols,
-                "Highest": [df[s].max() for s in ordered_mark_cols],
-                "Lowest": [df[s].min() for s in ordered_mark_cols],
-                "Average": [round(df[s].mean(), 2) for s in ordered_mark_cols],
-                "Distinction (≥75)": [(df[s] >= 75).sum() for s in ordered_mark_cols],
-                "100 out of 100": [(df[s] == 100).sum() for s in ordered_mark_cols],
-            }
-
-            for i, (label, values) in enumerate(summary.items(), start=2):
-                ws_summary.cell(row=i, column=1).value = label
-                ws_summary.cell(row=i, column=1).font = Font(bold=True)
-                for j, value in enumerate(values, start=2):
-                    ws_summary.cell(row=i, column=j).value = value
-
-            wb.save(filename)
+    def parse_and_save(self, filename, progress=None):
+        start = self.first_record.offset if self.first_record else 0
+        return convert_gazette(self.file_path, self.grade12, filename, progress=progress, cache=open_parse_cache(),
+                               start=start, grade_columns=self.grade_columns)
 
     def init_final_frame(self):
         self.final_frame = tk.Frame(self)
@@ -407,9 +367,162 @@ class ParserWindow(tk.Toplevel):
         self.master.deiconify()
 
 
+# -------------------------
+# Batch Window
+# -------------------------
+class BatchWindow(tk.Toplevel):
+    """Convert every gazette in a folder (see result_batch), grade detected per file."""
+
+    def __init__(self, master=None):
+        super().__init__(master)
+        self.master = master
+        self.title("CBSE Result Soft 1.4 - Batch")
+        self.geometry("600x360")
+        self.resizable(False, False)
+        self.center_window(600, 360)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.folder = None
+        self.cancel_event = threading.Event()
+        self.poll_id = None
+
+        tk.Label(self, text="Convert every TXT gazette in a folder", font=("Arial", 14)).pack(pady=10)
+        row = tk.Frame(self)
+        row.pack(pady=6)
+        self.choose_button = tk.Button(row, text="Choose Folder", command=self.select_folder,
+                                       font=("Tahoma", 12), width=15, bd=0, bg="pink")
+        self.choose_button.pack(side="left", padx=8)
+        self.folder_label = tk.Label(row, text="No folder selected", font=("Arial", 10))
+        self.folder_label.pack(side="left")
+
+        options = tk.Frame(self)
+        options.pack(pady=6)
+        tk.Label(options, text="Output format:").pack(side="left")
+        self.format_var = tk.StringVar(self, value="xlsx")
+        ttk.Combobox(options, textvariable=self.format_var, state="readonly", width=8,
+                     values=["xlsx", "csv", "parquet", "feather"]).pack(side="left", padx=6)
+        self.grades_var = tk.BooleanVar(self, value=False)
+        tk.Checkbutton(options, text="Include subject grade columns (A1..E)",
+                       variable=self.grades_var).pack(side="left", padx=6)
+
+        self.start_button = tk.Button(self, text="Convert All", command=self.start_batch,
+                                      font=("Tahoma", 12), width=20, bd=0, bg="lightgreen")
+        self.start_button.pack(pady=8)
+        self.progress_bar = ttk.Progressbar(self, length=480, maximum=100)
+        self.progress_bar.pack(pady=6)
+        self.status_label = tk.Label(self, text="", font=("Arial", 10))
+        self.status_label.pack()
+        self.cancel_button = tk.Button(self, text="Cancel", command=self.cancel_batch, width=12, bg="orange",
+                                       state="disabled")
+        self.cancel_button.pack(pady=6)
+        tk.Button(self, text="Back to Launcher", command=self.on_close, width=14).pack(pady=4)
+
+    def on_close(self):
+        self.cancel_event.set()
+        if self.poll_id:
+            self.after_cancel(self.poll_id)
+        self.destroy()
+        self.master.deiconify()
+
+    def center_window(self, w, h):
+        sw, sh = self.winfo_screenwidth(), self.winfo_screenheight()
+        x, y = (sw - w) // 2, (sh - h) // 2
+        self.geometry(f"{w}x{h}+{x}+{y}")
+
+    def select_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.folder = folder
+            self.folder_label.config(text=folder)
+
+    def start_batch(self):
+        if not self.folder:
+            messagebox.showerror("Error", "Please choose a folder.")
+            return
+        # Tk variables are read here, the worker thread must not touch Tk
+        fmt, grade_columns = self.format_var.get(), self.grades_var.get()
+        self.start_button.config(state="disabled")
+        self.choose_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.progress_bar["value"] = 0
+        self.status_label.config(text="Classifying files...")
+
+        self.events = queue.Queue()
+        self.cancel_event.clear()
+        threading.Thread(target=self.batch_worker, args=(self.folder, fmt, grade_columns), daemon=True).start()
+        self.poll_id = self.after(100, self.poll_batch)
+
+    def batch_worker(self, folder, fmt, grade_columns):
+        """Background thread: run the batch, posting progress events to self.events."""
+        def progress(stage, done, total):
+            if self.cancel_event.is_set():
+                raise Cancelled()
+            self.events.put((stage, done, total))
+
+        try:
+            run = run_batch(folder, fmt=fmt, cache=open_parse_cache(), grade_columns=grade_columns,
+                            progress=progress)
+            self.events.put(("done", run, None))
+        except Cancelled:
+            self.events.put(("cancelled", None, None))
+        except Exception as e:
+            self.events.put(("error", str(e), None))
+
+    def poll_batch(self):
+        """Apply queued progress events on the Tk thread (scheduled with after())."""
+        self.poll_id = None
+        while True:
+            try:
+                stage, done, total = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if stage == "batch":
+                # Converting the files is the first 80% of the bar, the consolidated outputs the rest
+                self.progress_bar["value"] = 80 * done / max(total, 1)
+                self.status_label.config(text=f"Converted {done} of {total} files...")
+            elif stage == "written":
+                self.progress_bar["value"] = 80 + 20 * done / max(total, 1)
+                self.status_label.config(text=f"Writing consolidated output... {done:,} of {total:,} rows")
+            else:
+                self.finish_batch(stage, done)
+                return
+        self.poll_id = self.after(100, self.poll_batch)
+
+    def cancel_batch(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state="disabled")
+        self.status_label.config(text="Cancelling (files already running are finished)...")
+
+    def finish_batch(self, stage, detail):
+        """detail is the message for stage "error" and run_batch's result for "done"."""
+        self.start_button.config(state="normal")
+        self.choose_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        if stage == "error":
+            self.status_label.config(text="")
+            messagebox.showerror("Error", detail)
+        elif stage == "cancelled":
+            self.status_label.config(text="")
+            messagebox.showinfo("Cancelled", "Batch conversion was cancelled.")
+        else:
+            files, consolidated, log_path = detail
+            self.progress_bar["value"] = 100
+            failed = [f.log_line() for f in files if f.error]
+            self.status_label.config(text=f"Done: {len(files) - len(failed)} of {len(files)} files converted.")
+            text = (f"✅ {len(files) - len(failed)} of {len(files)} files converted, "
+                    f"{sum(f.students for f in files):,} students.\n\n"
+                    + "".join(f"Grade {12 if is_grade12 else 10}: {os.path.basename(path)}\n"
+                              for is_grade12, path in consolidated.items())
+                    + f"\nRun log: {log_path}")
+            if failed:
+                text += "\n\n⚠ Not converted:\n" + "\n".join(failed)
+            messagebox.showinfo("Batch finished", text)
+
+
 # -------------------------
 # Run App
 # -------------------------
 if __name__ == "__main__":
+    freeze_support()  # parallel parsing in the PyInstaller build
     app = CBSEParserApp()
     app.mainloop()
@@ -0,0 +1,482 @@
+"""Micro-benchmarks for the gazette parser.
+
+Usage:
+    python bench_parser.py tokenizer --students 500000
+    python bench_parser.py parallel --workers 8
+    python bench_parser.py reader
+    python bench_parser.py startup --students 5000
+    python bench_parser.py sqlite --students 85000     # ~500k marks rows
+    python bench_parser.py check                       # correctness checks, exits non-zero on failure
+
+A synthetic gazette is generated in a temporary folder, so no real result
+file is needed. "check" asserts that the fast paths still match their
+reference versions (see CHECKS).
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import result_core as core
+import result_store
+import result_update
+
+
+# -------------------------
+# Synthetic gazette
+# -------------------------
+GRADE10_CODES = [["184"], ["085", "122"], ["041", "241"], ["086"], ["087"], ["402"]]
+GRADE_BANDS = ((91, "A1"), (81, "A2"), (71, "B1"), (61, "B2"), (51, "C1"), (41, "C2"), (33, "D1"), (21, "D2"))
+
+
+def grade_for(mark):
+    for lowest, grade in GRADE_BANDS:
+        if mark >= lowest:
+            return grade
+    return "E"
+
+
+def write_gazette(path, students, seed=1):
+    """Write a Grade 10 style gazette with `students` records to `path`."""
+    rnd = random.Random(seed)
+    names = ["AARAV", "SITA", "RAM", "KUMAR", "SINGH", "PRIYA", "DEV"]
+    with open(path, "w") as f:
+        f.write("CENTRAL BOARD OF SECONDARY EDUCATION\nRESULT GAZETTE\n\n")
+        for i in range(students):
+            if i % 25 == 0:
+                f.write(f"\nSCHOOL : 12345  PAGE {i // 25 + 1}\n\n")
+            codes = [rnd.choice(choices) for choices in GRADE10_CODES]
+            marks = [rnd.randint(33, 100) for _ in codes]
+            name = " ".join(rnd.choice(names) for _ in range(rnd.randint(1, 3)))
+            head = f"{20000000 + i:08d}   {rnd.choice('MF')}   {name:<36}"
+            f.write(head + "".join(f"{c:<8}" for c in codes) + "      " + rnd.choice(["PASS", "PASS", "COMP"]) + "\n")
+            f.write(" " * len(head) + "".join(f"{m:03d} {grade_for(m):<4}" for m in marks) + "\n")
+
+
+# -------------------------
+# Reference implementation (pre-tokenizer)
+# -------------------------
+def legacy_tokenize(line1, line2):
+    m = re.match(r"^(\d{8})\s+([MF])\s+(.*?)\s+(\d{3})", line1)
+    codes = re.findall(r"\b\d{3}\b", line1)
+    marks = [int(m) for m in re.findall(r"(\d{1,3})\s+[A-D][12]", line2)]
+    result = re.search(r"\b(PASS|FAIL|COMP|ABST)\b", line1 + " " + line2, re.I)
+    return m.group(1), m.group(2), m.group(3).strip(), codes, marks, result.group(1).upper() if result else ""
+
+
+def load_pairs(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return [(head.string, line2, shift) for head, line2, _, shift in core.iter_record_lines(f)]
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed:8.2f} s {count / elapsed:12,.0f} records/s")
+    return elapsed
+
+
+# -------------------------
+# Benchmarks
+# -------------------------
+def bench_tokenizer(path, args):
+    pairs = load_pairs(path)
+    heads = [(core.STUDENT_LINE_RE.match(line1), line2, shift) for line1, line2, shift in pairs]
+
+    def before():
+        for line1, line2, _ in pairs:
+            if re.match(r"^\d{8}\s", line1):
+                legacy_tokenize(line1, line2)
+
+    def after():
+        for line1, line2, shift in pairs:
+            head = core.STUDENT_LINE_RE.match(line1)
+            if head:
+                core.tokenize_record(head, line2, shift)
+
+    assert [legacy_tokenize(a, b) for a, b, _ in pairs[:1000]] == \
+        [r[:5] + (r[6],) for r in (core.tokenize_record(*h) for h in heads[:1000])]
+    old = timed("before (5 regex passes)", len(pairs), before)
+    new = timed("after (compiled tokenizer)", len(pairs), after)
+    print(f"speed-up: {old / new:.2f}x")
+
+
+def bench_parallel(path, args):
+    serial = core.parse_gazette(path, False)
+    old = timed("serial parse", len(serial), lambda: core.parse_gazette(path, False))
+    new = timed(f"parallel parse ({args.workers} workers)", len(serial),
+                lambda: core.parse_gazette(path, False, args.workers))
+    assert core.parse_gazette(path, False, args.workers).marks == serial.marks
+    print(f"speed-up: {old / new:.2f}x")
+
+
+def bench_reader(path, args):
+    count = len(core.parse_gazette(path, False))
+    old = timed("text reader (decode lines)", count, lambda: core.parse_gazette(path, False, reader="text"))
+    new = timed("mmap reader (bytes regexes)", count, lambda: core.parse_gazette(path, False, reader="mmap"))
+    print(f"speed-up: {old / new:.2f}x")
+
+
+# Runs in a fresh interpreter so nothing is imported yet
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import Result_Soft_ver_5 as soft
+try:
+    app = soft.CBSEParserApp()
+    app.update()
+    print("first window", time.perf_counter() - start)
+except soft.tk.TclError:
+    print("import (no display)", time.perf_counter() - start)
+soft.convert_gazette(sys.argv[1], False, sys.argv[2])
+print("first export", time.perf_counter() - start)
+"""
+
+
+def bench_startup(path, args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = {}
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, path, path + ".xlsx"], cwd=here,
+                             capture_output=True, text=True, check=True).stdout
+        for line in out.splitlines():
+            label, seconds = line.rsplit(" ", 1)
+            timings.setdefault(label, []).append(float(seconds))
+    for label, values in timings.items():
+        print(f"{label:<28}{statistics.median(values):8.2f} s (median of {len(values)})")
+
+
+def bench_sqlite(path, args):
+    columns = core.parse_gazette(path, False)
+    marks_rows = int((columns.marks_matrix() != core.ABSENT_MARK).sum())
+    database = path + ".sqlite"
+    conn = result_store.open_store(database)
+    try:
+        elapsed = timed("sqlite load (one transaction)", len(columns),
+                        lambda: result_store.store_results(conn, columns, False, path))
+        # Loading the same gazette again replaces its rows
+        timed("sqlite reload (replace)", len(columns), lambda: result_store.store_results(conn, columns, False, path))
+        assert conn.execute("SELECT COUNT(*) FROM marks").fetchone()[0] == marks_rows
+    finally:
+        conn.close()
+    print(f"{marks_rows:,} marks rows, {marks_rows / elapsed:,.0f} marks rows/s, "
+          f"{os.path.getsize(database) / 1e6:.1f} MB")
+
+
+# -------------------------
+# Checks
+# -------------------------
+def check_rank(path, args):
+    """update_dense_rank against a full dense_rank on random updates, ties and new students included."""
+    import numpy as np
+
+    rnd = np.random.default_rng(args.seed)
+    for case in range(args.cases):
+        n_old, n_new = int(rnd.integers(0, 60)), int(rnd.integers(0, 10))
+        spread = int(rnd.choice([5, 50, 1000]))  # few distinct values = many ties
+        before = rnd.integers(0, spread, n_old) / 4
+        changed = rnd.choice(n_old, size=int(rnd.integers(0, n_old + 1)), replace=False)
+        after = np.concatenate([before, rnd.integers(0, spread, n_new) / 4])
+        after[changed] = rnd.integers(0, spread, len(changed)) / 4
+        touched = np.concatenate([changed, np.arange(n_old, n_old + n_new)]).astype(np.int64)
+        got = result_update.update_dense_rank(before, after, core.dense_rank(before), touched)
+        assert np.array_equal(got, core.dense_rank(after)), (case, before, after, touched)
+    print(f"update_dense_rank = dense_rank in {args.cases} random cases")
+
+
+def check_update(path, args):
+    """apply_update on a parsed gazette against recomputing every total and rank from scratch."""
+    import numpy as np
+
+    rnd = random.Random(args.seed)
+    columns = core.parse_gazette(path, False)
+    metrics = core.result_metrics(columns, False)
+    update = core.ResultColumns(core.SUBJECTS[False])
+    codes = core.SUBJECTS[False].codes
+    # Few enough changed values to take the incremental path (see MAX_INCREMENTAL_VALUES)
+    rows = rnd.sample(range(len(columns)), min(len(columns), 20))
+    for i, roll in enumerate([columns.rolls[row] for row in rows] + [30000000 + n for n in range(5)]):
+        taken = rnd.sample(codes, 5)
+        marks = [rnd.randint(0, 100) for _ in taken]
+        update.add(str(roll), "F", f"STUDENT {i}", taken, marks, [grade_for(mark) for mark in marks], "PASS")
+    result_update.apply_update(columns, metrics, update, False)
+    full = core.result_metrics(columns, False)
+    for name, values in full.items():
+        assert np.array_equal(metrics[name], values), name
+    print(f"apply_update = full rebuild for {len(update)} changed or new students")
+
+
+def record_lines(name, codes, marks, indent=0):
+    """A student line and its marks line with every mark (None: no mark) under its code; extra marks follow."""
+    head = f"{' ' * indent}20000001   M   {name:<36}"
+    line1 = head + "".join(f"{code:<8}" for code in codes) + "      PASS"
+    line2 = " " * (len(head) - indent) + "".join(
+        " " * 8 if mark is None else f"{mark:03d} {grade_for(mark):<4}" for mark in marks)
+    return [line1, line2]
+
+
+# (student line name, codes, marks under them, expected codes, expected issues)
+ALIGN_CASES = [
+    ("CLEAN", ["184", "085", "402", "041", "086"], [90, 80, 70, 60, 50], ["184", "085", "402", "041", "086"], []),
+    ("RAM 123", ["184", "085", "402"], [90, 80, 70], ["184", "085", "402"],
+     ["number 123 in the name", "name read as 'RAM 123'"]),
+    ("GAP", ["184", "085", "402", "041"], [90, None, 70, 60], ["184", "402", "041"],
+     ["subject code 085 has no mark below it"]),
+    ("EXTRA", ["184", "085", "402"], [90, 80, 70, 60], ["184", "085", "402"], ["mark 60 C1 is under no subject code"]),
+    ("OVER", ["184", "085", "402"], [90, 180, 70], ["184", "085", "402"],
+     ["mark 180 for subject code 085 is over 100"]),
+]
+
+
+def check_align(path, args):
+    """Column alignment on hand-made records, and the fast path against align_record on clean ones."""
+    cases = [(record_lines(name, codes, marks), expected, issues)
+             for name, codes, marks, expected, issues in ALIGN_CASES]
+    # Indented student line: shift makes up for it
+    cases.append((record_lines("INDENTED", ["184", "085"], [90, 80], indent=4), ["184", "085"], []))
+    # Layout lost: marks packed to the left, paired in order
+    cases.append(([record_lines("FLAT", ["184", "085", "402"], [])[0], "090 A1 080 A2"], ["184", "085"],
+                  ["3 subject codes but 2 marks, paired in order"]))
+    cases.append((record_lines("NO MARKS", ["184", "085"], [])[:1], [], ["no marks line below the student line"]))
+    for lines, expected, expected_issues in cases:
+        for encode in (False, True):  # text and mmap readers
+            lines_in = [line.encode() for line in lines] if encode else lines
+            regex = core.STUDENT_LINE_RE_B if encode else core.STUDENT_LINE_RE
+            (head, line2, _, shift), = core.iter_record_lines(lines_in, regex)
+            _, _, _, codes, _, _, _, issues = core.tokenize_record(head, line2, shift)
+            assert [core.as_text(code) for code in codes] == expected, (lines, codes)
+            assert issues == expected_issues, (lines, issues)
+
+    with open(path, encoding="utf-8") as f:
+        for head, line2, _, shift in core.iter_record_lines(f):
+            roll, _, name, codes, marks, grades, _, issues = core.tokenize_record(head, line2, shift)
+            assert (name, codes, marks, grades, issues) == core.align_record(head, line2, shift), roll
+    print(f"alignment: {len(cases)} hand-made records, fast path = align_record on the synthetic gazette")
+
+
+def write_awkward_gazette(source, path):
+    """The synthetic gazette with CRLF, extra blank lines, student lines without marks and one at the end."""
+    with open(source) as f:
+        lines = f.read().splitlines()[:3000]
+    out, students = [], 0
+    for i, line in enumerate(lines):
+        out.append(line)
+        if i % 7 == 0:
+            out.append("")
+        if core.STUDENT_LINE_RE.match(line.strip()):
+            students += 1
+            if students % 53 == 0:
+                out.append(line.replace("2000", "3000", 1))  # a second student line right after the first
+    out.append(out[-2].replace("2000", "4000", 1))  # student line on the last line
+    with open(path, "w", newline="") as f:
+        f.write("\r\n".join(out))
+
+
+def check_ranges(path, args):
+    """Serial parse against 2..50 byte ranges merged, both readers, on an awkward gazette."""
+    awkward = path + ".awkward.txt"
+    write_awkward_gazette(path, awkward)
+    serial = core.parse_range(awkward, False)
+    assert serial.issues[-1][2] == "no marks line below the student line"
+    fields = ("rolls", "genders", "names", "results", "marks", "grades", "issues")
+    for reader in core.READERS:
+        for parts in range(2, 51):
+            bounds = core.find_record_boundaries(awkward, parts)
+            merged = core.ResultColumns(core.SUBJECTS[False])
+            for start, end in zip(bounds, bounds[1:]):
+                part = core.parse_range(awkward, False, start, end, reader)
+                part.shift_issues(core.count_lines(awkward, 0, start))
+                merged.extend(part)
+            for field in fields:
+                got, want = getattr(merged, field), getattr(serial, field)
+                if reader == "mmap" and field == "names":
+                    got = [name.decode() for name in got]
+                assert got == want, (reader, parts, field)
+    print(f"ranges: serial = 2..50 ranges with both readers ({len(serial)} students, {len(serial.issues)} issues)")
+
+
+def same_columns(a, b):
+    """True if two ResultColumns hold the same students, marks, grades and issues (readers may differ)."""
+    import numpy as np
+
+    a, b = a.to_arrays(), b.to_arrays()
+    return a.keys() == b.keys() and all(np.array_equal(a[name], b[name]) for name in a)
+
+
+def check_cache(path, args):
+    """A truncated or empty cache entry is a miss: it is removed, and the gazette parsed and cached again."""
+    import result_cache
+
+    want = core.parse_gazette(path, False)
+    with tempfile.TemporaryDirectory() as folder:
+        cache = result_cache.ParseCache(folder)
+        key = cache.key(path, False)
+        entry = cache.entry_path(key)
+        assert same_columns(cache.parse(path, False), want) and os.path.exists(entry)
+        assert same_columns(cache.load(key, False), want)
+        for size in (os.path.getsize(entry) // 2, 0):
+            with open(entry, "r+b") as f:
+                f.truncate(size)
+            assert cache.load(key, False) is None and not os.path.exists(entry), size
+            assert same_columns(cache.parse(path, False), want) and os.path.exists(entry), size
+    print("cache: truncated and empty entries are misses, removed and rebuilt")
+
+
+def check_aggregate(path, args):
+    """Per-file aggregates saved, loaded and added up give the Summary of all the files parsed as one."""
+    files = [path] + [f"{path}.{seed}.txt" for seed in (2, 3)]
+    for seed, name in enumerate(files[1:], start=2):
+        write_gazette(name, args.students // seed, seed)
+    merged = core.ResultColumns(core.SUBJECTS[False])
+    total = None
+    for name in files:
+        columns = core.parse_gazette(name, False)
+        merged.extend(columns)
+        core.ResultAggregate.from_columns(columns, False).save(name + ".summary.json")
+        stats = core.ResultAggregate.load(name + ".summary.json")
+        total = stats if total is None else total + stats
+    whole = core.ResultAggregate.from_columns(merged, False)
+    assert total.students == whole.students == len(merged)
+    assert total.summary() == whole.summary()
+    print(f"aggregate: {len(files)} saved aggregates added up = one aggregate of {len(merged)} students")
+
+
+def check_start(path, args):
+    """Parsing from the sniffed first record gives the same columns and issue lines as from byte 0."""
+    awkward = path + ".start.txt"
+    write_awkward_gazette(path, awkward)
+    for name in (path, awkward):
+        first = core.sniff_first_record(name)
+        assert first is not None and first.offset > 0 and core.detect_grade(first.codes) is False, name
+        for reader in core.READERS:
+            for workers in (1, 2):
+                want = core.parse_gazette(name, False, workers, reader)
+                got = core.parse_gazette(name, False, workers, reader, start=first.offset)
+                assert same_columns(got, want), (name, reader, workers)
+    print(f"start: parse from the first record (byte {first.offset}) = parse from byte 0")
+
+
+def check_store(path, args):
+    """The SQLite store holds one student row per parsed student and one marks row per mark, after a reload too."""
+    columns = core.parse_gazette(path, False)
+    matrix = columns.marks_matrix()
+    taken = matrix != core.ABSENT_MARK
+    per_code = {code: int(count) for code, count in zip(core.SUBJECTS[False].codes, taken.sum(axis=0)) if count}
+    conn = result_store.open_store(path + ".check.sqlite")
+    try:
+        for _ in range(2):  # the second load replaces the first
+            gazette_id = result_store.store_results(conn, columns, False, path)
+            assert conn.execute("SELECT COUNT(*) FROM gazettes").fetchone()[0] == 1
+            assert conn.execute("SELECT COUNT(*) FROM students WHERE gazette_id = ?",
+                                (gazette_id,)).fetchone()[0] == len(columns)
+            rows = dict(conn.execute("SELECT subject_code, COUNT(*) FROM marks GROUP BY subject_code"))
+            assert rows == per_code, (rows, per_code)
+            total = conn.execute("SELECT SUM(mark) FROM marks").fetchone()[0]
+            assert total == int(matrix[taken].sum())
+    finally:
+        conn.close()
+    print(f"store: {len(columns)} students and {int(taken.sum())} marks rows, also after a reload")
+
+
+def check_catalog(path, args):
+    """subjects.example.json gives the built-in header maps (in slot order) and main subject sets."""
+    if core.CATALOG_PATH:
+        print(f"catalog: skipped, {core.CATALOG_PATH} replaces the built-in maps")
+        return
+    example = os.path.join(os.path.dirname(os.path.abspath(core.__file__)), "subjects.example.json")
+    catalog = core.read_catalog(example)
+    builtin = {False: (core.GRADE10_SUBJECT_HEADER_MAP, {"": core.MAIN_SUBJECTS_10}),
+               True: (core.GRADE12_SUBJECT_HEADER_MAP, core.STREAMS_12)}
+    assert catalog.keys() == builtin.keys()
+    for is_grade12, (header_map, mains) in builtin.items():
+        got_map, got_mains = catalog[is_grade12]
+        assert list(got_map.items()) == list(header_map.items()), is_grade12
+        assert list(got_mains.items()) == list(mains.items()), (is_grade12, got_mains)
+    print(f"catalog: {os.path.basename(example)} = built-in subject maps")
+
+
+def check_writers(path, args):
+    """CSV (and Parquet/Feather when pyarrow is installed) read back as the written table and Issues."""
+    import pandas as pd
+
+    awkward = path + ".writers.txt"
+    write_awkward_gazette(path, awkward)
+    columns = core.parse_gazette(path, False)
+    columns.extend(core.parse_gazette(awkward, False))  # issues, and more rows than one CSV chunk
+    df = core.build_result_frame(columns, False, core.result_metrics(columns, False), grade_columns=True)
+    issues = core.build_issues_frame(columns)
+    readers = {".csv": lambda name: pd.read_csv(name, dtype=str, keep_default_na=False)}
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("writers: pyarrow not installed, Parquet and Feather not checked")
+    else:
+        readers.update({".parquet": pd.read_parquet, ".feather": pd.read_feather})
+    for ext, read in readers.items():
+        stem = path + ".out"
+        core.write_output(df, stem + ext, extra_sheets={"Issues": issues})
+        for want, got in ((df, read(stem + ext)), (issues, read(f"{stem}-Issues{ext}"))):
+            assert list(got.columns) == list(want.columns), ext
+            if ext == ".csv":  # text: compare the cells as written
+                want = want.astype(object).where(want.notna(), "").astype(str)
+            pd.testing.assert_frame_equal(got, want, check_dtype=ext != ".csv", check_categorical=False)
+    print(f"writers: {', '.join(readers)} read back as written ({len(df)} rows, {len(issues)} issues)")
+
+
+CHECKS = {
+    "rank": check_rank,
+    "update": check_update,
+    "align": check_align,
+    "ranges": check_ranges,
+    "cache": check_cache,
+    "aggregate": check_aggregate,
+    "start": check_start,
+    "store": check_store,
+    "catalog": check_catalog,
+    "writers": check_writers,
+}
+
+
+def run_checks(path, args):
+    for check in CHECKS.values():
+        check(path, args)
+    print("all checks passed")
+
+
+BENCHMARKS = {
+    "tokenizer": bench_tokenizer,
+    "parallel": bench_parallel,
+    "reader": bench_reader,
+    "startup": bench_startup,
+    "sqlite": bench_sqlite,
+    "check": run_checks,
+}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    ap.add_argument("--students", type=int, help="synthetic gazette size (default: 500000, 5000 for check)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--repeat", type=int, default=5, help="runs for the startup benchmark")
+    ap.add_argument("--cases", type=int, default=3000, help="random cases per check")
+    ap.add_argument("--seed", type=int, default=1, help="random seed for the checks")
+    args = ap.parse_args()
+    if args.students is None:
+        args.students = 5000 if args.benchmark == "check" else 500000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "gazette.txt")
+        write_gazette(path, args.students)
+        print(f"{args.students:,} students, {os.path.getsize(path) / 1e6:.1f} MB")
+        BENCHMARKS[args.benchmark](path, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Convert a whole folder of gazettes in one run (result_cli --batch, the launcher's Batch button).
+
+Every .txt file in the folder is classified by grade from its first
+students, then the files are converted over one process pool sized to
+the CPU count, largest first. Each file gets its own output; the
+students of all files of one grade are also ranked together in one
+consolidated output per grade (Grade 10 and 12 columns differ), and
+batch_run.log lists every file with its time and throughput.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import result_core as core
+
+LOG_NAME = "batch_run.log"
+
+
+def find_gazettes(folder):
+    """The .txt files directly in folder, sorted by name."""
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(".txt") and os.path.isfile(os.path.join(folder, name)))
+
+
+def consolidated_path(out_dir, is_grade12, fmt="xlsx"):
+    """<out_dir>/consolidated_<grade>.<fmt>, the output ranking all files of one grade."""
+    return os.path.join(out_dir, f"consolidated_{12 if is_grade12 else 10}.{fmt}")
+
+
+class BatchFile:
+    """One gazette of a batch run and how its conversion went.
+
+    error is "SKIPPED (...)" for a file that could not be classified and
+    "ERROR ..." for one that failed; seconds is the time its job took.
+    """
+
+    __slots__ = ("path", "is_grade12", "output", "students", "issues", "seconds", "error")
+
+    def __init__(self, path, is_grade12=None, output=None, error=None):
+        self.path = path
+        self.is_grade12 = is_grade12
+        self.output = output
+        self.students = 0
+        self.issues = 0
+        self.seconds = 0.0
+        self.error = error
+
+    @property
+    def rate(self):
+        """Students converted per second."""
+        return self.students / self.seconds if self.seconds else 0.0
+
+    def log_line(self):
+        name = os.path.basename(self.path)
+        if self.error:
+            return f"{name}: {self.error}"
+        return (f"{name}: Grade {12 if self.is_grade12 else 10}, {self.students} students, {self.issues} issues, "
+                f"{self.seconds:.2f} s ({self.rate:,.0f} students/s) -> {os.path.basename(self.output)}")
+
+
+def classify_files(paths, out_dir, fmt="xlsx"):
+    """A BatchFile per path, plus {path: first record offset} for the ones to convert.
+
+    Files classify_gazette cannot place confidently are marked SKIPPED.
+    """
+    files, starts = [], {}
+    for path in paths:
+        info = core.classify_gazette(path)
+        if info is None or not info.confident:
+            reason = "no student records found" if info is None else \
+                f"{info.grade_text} at {info.confidence:.0%} confidence"
+            files.append(BatchFile(path, error=f"SKIPPED ({reason})"))
+            continue
+        name = os.path.splitext(os.path.basename(path))[0] + "." + fmt
+        files.append(BatchFile(path, info.is_grade12, os.path.join(out_dir, name)))
+        starts[path] = info.first.offset
+    return files, starts
+
+
+def convert_file(path, is_grade12, filename, start=0, workers=1, cache=None, **options):
+    """Pool job: parse and write one gazette. Returns (columns, seconds taken).
+
+    options are export_columns' (grade_columns, snapshot, aggregate, database, ...).
+    """
+    began = time.perf_counter()
+    columns = core.load_gazette(path, is_grade12, workers, cache=cache, start=start)
+    core.export_columns(columns, is_grade12, path, filename, **options)
+    return columns, time.perf_counter() - began
+
+
+def job_workers(jobs, workers=None):
+    """Worker processes convert_files uses for these jobs."""
+    workers = workers or os.cpu_count()
+    if len(jobs) == 1:
+        return min(workers, core.default_workers(jobs[0]["path"]))
+    return min(workers, max(len(jobs), 1))
+
+
+def convert_files(jobs, workers=None, progress=None):
+    """Run convert_file(**job) for every job dict, yielding (job, (columns, seconds), error) as files finish.
+
+    error is None, or the exception the job raised. The jobs go over one
+    process pool of job_workers processes, largest file first; a single
+    job runs in this process instead, with the file itself split across
+    the workers. progress gets a ("batch", files done, files) event per
+    file; raising Cancelled from it stops the run (files already running
+    are finished).
+    """
+    workers = job_workers(jobs, workers)
+    core.report(progress, "batch", 0, len(jobs))
+    if len(jobs) == 1:
+        try:
+            result, error = convert_file(workers=workers, **jobs[0]), None
+        except core.Cancelled:
+            raise
+        except Exception as e:
+            result, error = None, e
+        core.report(progress, "batch", 1, 1)
+        yield jobs[0], result, error
+        return
+
+    jobs = sorted(jobs, key=lambda job: os.path.getsize(job["path"]), reverse=True)
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(convert_file, **job): job for job in jobs}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, e
+                core.report(progress, "batch", done, len(jobs))
+                yield futures[future], result, error
+        except core.Cancelled:
+            pool.shutdown(cancel_futures=True)
+            raise
+
+
+def write_consolidated(parts, is_grade12, filename, grade_columns=False, progress=None, snapshot=None,
+                       aggregate=None):
+    """Rank the students of all (path, columns) parts together and write them to filename.
+
+    The parts are left as they are. snapshot (.npz) and aggregate (.json)
+    are optional paths as in convert_gazette. Returns the DataFrame; its
+    Issues sheet has the file of every issue.
+    """
+    import pandas as pd
+
+    columns = core.ResultColumns(core.SUBJECTS[is_grade12])
+    issues = []
+    for path, part in parts:
+        columns.extend(part)
+        if part.issues:
+            issues.append(core.build_issues_frame(part).assign(File=os.path.basename(path)))
+    metrics = core.result_metrics(columns, is_grade12)
+    if snapshot:
+        core.save_snapshot(snapshot, columns, metrics)
+    stats, streams = core.result_aggregates(columns, is_grade12, metrics)
+    if aggregate:
+        stats.save(aggregate)
+    df = core.build_result_frame(columns, is_grade12, metrics, grade_columns)
+    extra = {"Issues": pd.concat(issues, ignore_index=True)} if issues else {}
+    core.write_output(df, filename, progress, extra_sheets=extra, summary=stats.summary(),
+                      sections=core.stream_sections(streams))
+    return df
+
+
+def run_batch(folder, out_dir=None, fmt="xlsx", workers=None, cache=None, grade_columns=False, progress=None,
+              **store):
+    """Convert every gazette in folder; returns (BatchFiles, {is_grade12: consolidated path}, log path).
+
+    Outputs and the log go to out_dir (default: folder). progress gets
+    convert_files' "batch" events and the "written" events of the
+    consolidated outputs; raising Cancelled from it stops the run. store
+    holds convert_gazette's database/school/year.
+    """
+    out_dir = out_dir or folder
+    paths = find_gazettes(folder)
+    if not paths:
+        raise ValueError(f"No .txt gazettes in {folder}")
+    core.output_format(consolidated_path(out_dir, False, fmt))  # fail before converting, not after
+    os.makedirs(out_dir, exist_ok=True)
+
+    began = time.perf_counter()
+    files, starts = classify_files(paths, out_dir, fmt)
+    jobs = [dict(path=f.path, is_grade12=f.is_grade12, filename=f.output, start=starts[f.path], cache=cache,
+                 grade_columns=grade_columns, **store) for f in files if not f.error]
+    workers = job_workers(jobs, workers)
+    by_path = {f.path: f for f in files}
+    parts = {}
+    for job, result, error in convert_files(jobs, workers, progress):
+        f = by_path[job["path"]]
+        if error:
+            f.error = f"ERROR {error}"
+        else:
+            parts[f.path], f.seconds = result
+            f.students, f.issues = len(parts[f.path]), len(parts[f.path].issues)
+
+    consolidated = {}
+    for is_grade12 in (False, True):
+        done = [(f.path, parts[f.path]) for f in files if f.path in parts and f.is_grade12 == is_grade12]
+        if done:
+            consolidated[is_grade12] = consolidated_path(out_dir, is_grade12, fmt)
+            write_consolidated(done, is_grade12, consolidated[is_grade12], grade_columns, progress)
+    seconds = time.perf_counter() - began
+
+    log_path = os.path.join(out_dir, LOG_NAME)
+    with open(log_path, "w", encoding="utf-8") as log:
+        log.write("\n".join(batch_log(folder, files, consolidated, seconds, workers)) + "\n")
+    return files, consolidated, log_path
+
+
+def batch_log(folder, files, consolidated, seconds, workers):
+    """The lines of batch_run.log: one per file, one per consolidated output and the totals."""
+    lines = [f"Batch run {time.strftime('%Y-%m-%d %H:%M:%S')}: {folder}, {workers} worker processes"]
+    lines += [f.log_line() for f in files]
+    for is_grade12, path in consolidated.items():
+        done = [f for f in files if not f.error and f.is_grade12 == is_grade12]
+        lines.append(f"Grade {12 if is_grade12 else 10}: {len(done)} files, "
+                     f"{sum(f.students for f in done)} students -> {os.path.basename(path)}")
+    students = sum(f.students for f in files)
+    failed = sum(1 for f in files if f.error)
+    lines.append(f"Total: {len(files) - failed} of {len(files)} files, {students} students in {seconds:.1f} s "
+                 f"({students / seconds if seconds else 0:,.0f} students/s)")
+    return lines
@@ -0,0 +1,131 @@
+"""On-disk cache of parsed gazettes.
+
+Parsed ResultColumns are saved as compressed .npz files keyed by the
+gazette's content hash, the grade, a hash of that grade's subject map
+and result_core.PARSER_VERSION, so exporting the same file again skips
+parsing (and editing the subject catalog does not serve stale parses). The least recently used
+entries are deleted once the cache grows past its size limit.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import result_core as core
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+HASH_BLOCK = 1024 * 1024
+
+
+def default_cache_dir():
+    """Per-user cache folder (%LOCALAPPDATA% on Windows, ~/.cache elsewhere)."""
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "CBSE Result Soft", "parse_cache")
+
+
+def file_digest(path):
+    """BLAKE2b hex digest of the file contents."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def registry_digest(registry):
+    """Short hash of a SubjectRegistry's code -> label map."""
+    text = "\n".join(f"{code}={label}" for code, label in zip(registry.codes, registry.labels))
+    return hashlib.blake2b(text.encode(), digest_size=6).hexdigest()
+
+
+class ParseCache:
+    """Size-bounded LRU cache of parsed gazettes in a folder of .npz files."""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, path, is_grade12):
+        grade = 12 if is_grade12 else 10
+        # Unknown codes are dropped while parsing, so a parse is only valid for the map it used
+        subjects = registry_digest(core.SUBJECTS[is_grade12])
+        return f"{file_digest(path)}-g{grade}-s{subjects}-v{core.PARSER_VERSION}"
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key, is_grade12):
+        """Cached ResultColumns for key, or None. A hit marks the entry as recently used."""
+        import numpy as np
+
+        path = self.entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                columns = core.ResultColumns.from_arrays(core.SUBJECTS[is_grade12], arrays)
+            os.utime(path)  # inside the try: another process may evict the entry meanwhile
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # Half-written (interrupted save, full disk) or from another subject map: drop it
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return columns
+
+    def store(self, key, columns):
+        """Save columns under key (atomically), then evict old entries."""
+        import numpy as np
+
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **columns.to_arrays())
+            os.replace(tmp, self.entry_path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue  # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def parse(self, path, is_grade12, workers=1, reader="mmap", progress=None, start=0):
+        """Like result_core.parse_gazette, but served from the cache when possible."""
+        key = self.key(path, is_grade12)
+        columns = self.load(key, is_grade12)
+        if columns is None:
+            columns = core.parse_gazette(path, is_grade12, workers, reader, progress, start)
+            self.store(key, columns)
+        else:
+            size = os.path.getsize(path)
+            core.report(progress, "read", size, size)
+            core.report(progress, "parsed", len(columns), None)
+        return columns
+
+
+def open_parse_cache(directory=None, max_bytes=DEFAULT_MAX_BYTES):
+    """ParseCache for directory, or None if the folder cannot be created (caching is optional)."""
+    try:
+        return ParseCache(directory, max_bytes)
+    except OSError:
+        return None
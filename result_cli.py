@@ -0,0 +1,238 @@
+"""Convert CBSE result gazettes to Excel from the command line.
+
+Examples:
+    python result_cli.py school_a.txt school_b.txt
+    python result_cli.py --grade 12 --out-dir results/ gazettes/*.txt
+    python result_cli.py --grade 12 --merge cluster_12.xlsx gazettes/*.txt
+    python result_cli.py --grade 10 --snapshot main_10.npz main_10.txt
+    python result_cli.py --grade 10 --update main_10.npz --snapshot after_comp.npz comp_10.txt
+    python result_cli.py --grade 10 --aggregate gazettes/*.txt
+    python result_cli.py --rollup cluster_10.xlsx gazettes/*.summary.json
+    python result_cli.py --format parquet --out-dir warehouse/ gazettes/*.txt
+    python result_cli.py --database results.sqlite --year 2025 gazettes/*.txt
+    python result_cli.py --batch gazettes/ --out-dir results/
+
+Works without a display: tkinter is never imported.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import result_core as core
+from result_batch import convert_files, run_batch, write_consolidated
+from result_cache import open_parse_cache
+from result_store import open_store, store_results
+from result_update import update_gazette
+
+
+def output_path(path, out_dir=None, suffix=".xlsx"):
+    """<out_dir>/<name><suffix> for an input <dir>/<name>.txt (same folder by default)."""
+    name = os.path.splitext(os.path.basename(path))[0] + suffix
+    return os.path.join(out_dir or os.path.dirname(path), name)
+
+
+def result_path(path, out_dir, fmt):
+    """Output file for an input gazette in the chosen --format."""
+    return output_path(path, out_dir, "." + fmt)
+
+
+def aggregate_path(path, out_dir, aggregate):
+    """Where --aggregate puts the per-file summary JSON (None when not asked for)."""
+    return output_path(path, out_dir, ".summary.json") if aggregate else None
+
+
+def resolve_grades(files, grade):
+    """{path: (is_grade12, first record offset)} for --grade 10/12/auto.
+
+    With "auto" every file is classified from its first students; files
+    that cannot be placed confidently are reported and left out.
+    """
+    grades = {}
+    for path in files:
+        info = core.classify_gazette(path)
+        offset = info.first.offset if info else 0
+        if grade != "auto":
+            grades[path] = (grade == "12", offset)
+        elif info is not None and info.confident:
+            grades[path] = (info.is_grade12, offset)
+        else:
+            reason = "no student records found" if info is None else \
+                f"{info.grade_text} at {info.confidence:.0%} confidence; pass --grade"
+            print(f"{path}: SKIPPED ({reason})", file=sys.stderr)
+    return grades
+
+
+def issue_note(count):
+    """", N issues" when records were listed on the Issues sheet."""
+    return f", {count} issues" if count else ""
+
+
+def convert_each(files, grades, out_dir, workers, cache=None, snapshot=None, aggregate=False, fmt="xlsx",
+                 database=None, school=None, year=None, grade_columns=False):
+    """Write one output file per input file, files spread over a process pool (see convert_files).
+
+    grades is the output of resolve_grades; fmt is the --format extension.
+    With database, every file is also loaded into that SQLite store.
+    """
+    jobs = [dict(path=path, is_grade12=grades[path][0], filename=result_path(path, out_dir, fmt),
+                 start=grades[path][1], cache=cache, aggregate=aggregate_path(path, out_dir, aggregate),
+                 grade_columns=grade_columns, database=database, school=school, year=year)
+            for path in files]
+    if snapshot:
+        jobs[0]["snapshot"] = snapshot  # main() allows --snapshot with a single gazette only
+    failed = 0
+    for job, result, error in convert_files(jobs, workers):
+        if error:
+            failed += 1
+            print(f"{job['path']}: ERROR {error}", file=sys.stderr)
+        else:
+            columns, seconds = result
+            print(f"{job['path']}: {len(columns)} students{issue_note(len(columns.issues))} -> {job['filename']} "
+                  f"({seconds:.1f} s)")
+    return failed
+
+
+def convert_merged(files, is_grade12, filename, workers, cache=None, snapshot=None, aggregate=False,
+                   database=None, school=None, year=None, grade_columns=False):
+    """Parse every file in a process pool and write one output ranked across all of them."""
+    parse = cache.parse if cache else core.parse_gazette
+    with ProcessPoolExecutor(workers) as pool:
+        parts = list(pool.map(parse, files, repeat(is_grade12), repeat(1), repeat("mmap")))
+    if database:
+        # Each gazette keeps its own school/year rows in the store
+        conn = open_store(database)
+        try:
+            for path, part in zip(files, parts):
+                store_results(conn, part, is_grade12, path, school, year)
+        finally:
+            conn.close()
+    df = write_consolidated(list(zip(files, parts)), is_grade12, filename, grade_columns, snapshot=snapshot,
+                            aggregate=aggregate_path(filename, None, aggregate))
+    print(f"{len(files)} files: {len(df)} students, {sum(len(part.issues) for part in parts)} issues -> {filename}")
+
+
+def rollup(files, filename, is_grade12=None):
+    """Combine saved per-file aggregates into one Summary workbook; no gazette is read."""
+    from openpyxl import Workbook
+
+    total = None
+    for path in files:
+        stats = core.ResultAggregate.load(path)
+        if is_grade12 is not None and stats.is_grade12 != is_grade12:
+            raise ValueError(f"{path}: not a Grade {12 if is_grade12 else 10} aggregate")
+        total = stats if total is None else total + stats
+    wb = Workbook(write_only=True)
+    core.write_summary_sheet(wb, total.summary())
+    if not wb.worksheets:
+        wb.create_sheet(title="Summary")
+    wb.save(filename)
+    print(f"{len(files)} aggregates: {total.students} students -> {filename}")
+
+
+def batch(ap, args):
+    """--batch: convert the folder with result_batch and print its run log."""
+    if args.files or args.merge or args.update or args.snapshot or args.rollup or args.aggregate:
+        ap.error("--batch takes no files and cannot be combined with --merge/--update/--snapshot/--rollup/--aggregate")
+    if not os.path.isdir(args.batch):
+        ap.error(f"folder not found: {args.batch}")
+    if args.grade != "auto":
+        print("--batch classifies every file itself; --grade is ignored", file=sys.stderr)
+    cache = None if args.no_cache else open_parse_cache(args.cache_dir)
+    try:
+        files, _, log_path = run_batch(args.batch, args.out_dir, args.format, args.workers, cache, args.with_grades,
+                                       database=args.database, school=args.school, year=args.year)
+    except ValueError as e:
+        ap.error(str(e))
+    with open(log_path, encoding="utf-8") as log:
+        print(log.read(), end="")
+    print(f"Run log -> {log_path}")
+    return 1 if any(f.error for f in files) else 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("files", nargs="*", help="gazette TXT files (.summary.json files with --rollup)")
+    ap.add_argument("--grade", choices=["auto", "10", "12"], default="auto",
+                    help="gazette grade (default: detected per file from its first students)")
+    ap.add_argument("--out-dir", help="folder for the output files (default: next to each TXT file)")
+    ap.add_argument("--format", choices=[ext[1:] for ext in core.OUTPUT_FORMATS], default="xlsx",
+                    help="output format; only xlsx has the Summary sheet (default: xlsx)")
+    ap.add_argument("--with-grades", action="store_true", help="add a <SUBJECT>-G grade column after every subject")
+    ap.add_argument("--merge", metavar="FILE",
+                    help="write one merged output instead of one per file (format from its extension)")
+    ap.add_argument("--batch", metavar="FOLDER",
+                    help="convert every TXT file in FOLDER: one output per file, one consolidated output per grade "
+                         "and a batch_run.log with the time per file")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    ap.add_argument("--cache-dir", help="parse cache folder (default: per-user cache)")
+    ap.add_argument("--no-cache", action="store_true", help="always parse, never use the parse cache")
+    ap.add_argument("--snapshot", metavar="NPZ", help="also save the parsed results (with totals and ranks) here")
+    ap.add_argument("--update", metavar="NPZ",
+                    help="apply the (single) supplementary gazette to this snapshot; adds a Changed sheet")
+    ap.add_argument("--aggregate", action="store_true",
+                    help="also write <name>.summary.json with the per-subject statistics (for --rollup)")
+    ap.add_argument("--rollup", metavar="XLSX", help="combine .summary.json files into one Summary workbook")
+    ap.add_argument("--database", metavar="SQLITE", help="also load the results into this SQLite database")
+    ap.add_argument("--school", help="school code stored with --database (default: from the gazette header)")
+    ap.add_argument("--year", type=int, help="exam year stored with --database (default: from the gazette header)")
+    args = ap.parse_args(argv)
+
+    if core.CATALOG_ERROR:
+        print(f"warning: subject catalog not used, using the built-in subjects ({core.CATALOG_ERROR})",
+              file=sys.stderr)
+    if args.batch:
+        return batch(ap, args)
+    if not args.files:
+        ap.error("no gazette files given (or use --batch FOLDER)")
+    missing = [path for path in args.files if not os.path.isfile(path)]
+    if missing:
+        ap.error(f"file not found: {', '.join(missing)}")
+    if args.rollup:
+        try:
+            rollup(args.files, args.rollup, None if args.grade == "auto" else args.grade == "12")
+        except (ValueError, KeyError) as e:
+            ap.error(f"cannot combine aggregates: {e}")
+        return 0
+    if (args.update or args.snapshot) and len(args.files) > 1 and not args.merge:
+        ap.error("--update/--snapshot need a single gazette (or --merge)")
+    if args.update and args.merge:
+        ap.error("--update cannot be combined with --merge")
+    if args.merge:
+        try:
+            core.output_format(args.merge)
+        except ValueError as e:
+            ap.error(str(e))
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    grades = resolve_grades(args.files, args.grade)
+    if args.update or args.merge:
+        kinds = {is_grade12 for is_grade12, _ in grades.values()}
+        if len(grades) < len(args.files) or len(kinds) != 1:
+            ap.error("--update/--merge need gazettes of one known grade; pass --grade")
+        is_grade12 = kinds.pop()
+    cache = None if args.no_cache else open_parse_cache(args.cache_dir)
+    if args.update:
+        filename = result_path(args.files[0], args.out_dir, args.format)
+        try:
+            df, changed = update_gazette(args.update, args.files[0], is_grade12, filename, args.snapshot,
+                                         args.workers, cache,
+                                         aggregate_path(args.files[0], args.out_dir, args.aggregate), args.with_grades)
+        except (ValueError, OSError) as e:  # snapshot of the other grade or subject map, unreadable, not an .npz
+            ap.error(f"cannot apply update: {e}")
+        print(f"{args.files[0]}: {len(changed)} students changed or added, {len(df)} in total -> {filename}")
+        return 0
+    if args.merge:
+        convert_merged(args.files, is_grade12, args.merge, args.workers, cache, args.snapshot, args.aggregate,
+                       args.database, args.school, args.year, args.with_grades)
+        return 0
+    files = [path for path in args.files if path in grades]
+    failed = convert_each(files, grades, args.out_dir, args.workers, cache, args.snapshot, args.aggregate,
+                          args.format, args.database, args.school, args.year, args.with_grades) if files else 0
+    return 1 if failed or len(files) < len(args.files) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1630 @@
+"""Parsing, ranking and Excel export for CBSE result gazettes.
+
+This module has no GUI dependency: Result_Soft_ver_5.py (Tkinter) and
+result_cli.py (command line) both build on it.
+
+numpy, pandas and openpyxl are imported inside the functions that need
+them, so importing this module (and opening the launcher) stays fast.
+"""
+import json
+import mmap
+import os
+import re
+import sys
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from enum import IntEnum
+from itertools import islice, repeat
+from types import MappingProxyType
+
+# -------------------------
+# Subject header maps
+# -------------------------
+# In output order: a subject's position here is its slot (see SubjectRegistry)
+GRADE10_SUBJECT_HEADER_MAP = {
+    "184": "ENG-184",
+    "085": "HND-085",
+    "402": "IT-402",
+    "041": "MAT-041",
+    "241": "MAT-241",
+    "086": "SCI-086",
+    "122": "SNK-122",
+    "087": "SST-087"
+}
+
+GRADE12_SUBJECT_HEADER_MAP = {
+    "301": "ENG-301",
+    "042": "PHY-042",
+    "043": "CHE-043",
+    "041": "MAT-041",
+    "044": "BIO-044",
+    "030": "ECO-030",
+    "054": "BST-054",
+    "055": "ACC-055",
+    "027": "HIS-027",
+    "028": "POL_SC-028",
+    "029": "GEO-029",
+    "049": "PAINT-049",
+    "048": "PHED-048",
+    "065": "IP-065"
+}
+
+# -------------------------
+# Main subject sets
+# -------------------------
+MAIN_SUBJECTS_10 = {"MAT-041", "MAT-241", "SCI-086", "SST-087", "ENG-184", "HND-085", "SNK-122"}
+MAIN_SUBJECTS_12_PCM = {"ENG-301", "PHY-042", "CHE-043", "MAT-041", "PHED-048", "IP-065"}
+MAIN_SUBJECTS_12_PCB = {"ENG-301", "PHY-042", "CHE-043", "BIO-044", "PHED-048", "IP-065"}
+MAIN_SUBJECTS_12_COM = {"ENG-301", "ECO-030", "BST-054", "ACC-055", "PHED-048", "IP-065"}
+MAIN_SUBJECTS_12_ARTS = {"ENG-301", "HIS-027", "POL_SC-028", "GEO-029", "PAINT-049", "IP-065"}
+
+STREAMS_12 = {
+    "PCM": MAIN_SUBJECTS_12_PCM,
+    "PCB": MAIN_SUBJECTS_12_PCB,
+    "COM": MAIN_SUBJECTS_12_COM,
+    "ARTS": MAIN_SUBJECTS_12_ARTS,
+}
+
+# -------------------------
+# Subject catalog file
+# -------------------------
+# An optional catalog next to the program replaces the built-in maps above:
+#   {"subjects": [{"code": "184", "label": "ENG-184", "grade": 10, "is_main": true},
+#                 {"code": "042", "label": "PHY-042", "grade": 12, "streams": ["PCM", "PCB"]}, ...]}
+# Subjects are output in file order; "grade" may also be [10, 12]. A Grade 12
+# subject is a main subject of every stream it lists (unless "is_main" is false).
+CATALOG_NAMES = ("subjects.json", "subjects.toml")  # .toml needs Python 3.11+
+
+
+def catalog_path():
+    """The subject catalog next to the executable (or this module), None if there is none."""
+    folder = os.path.dirname(sys.executable if getattr(sys, "frozen", False) else os.path.abspath(__file__))
+    for name in CATALOG_NAMES:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def read_catalog(path):
+    """Parse a subject catalog into {is_grade12: (header map, {stream: main subject labels})}.
+
+    Only grades with subjects in the file are returned; Grade 10 main
+    subjects are under stream "". Raises ValueError for a malformed entry.
+    """
+    try:
+        if path.endswith(".toml"):
+            import tomllib
+
+            with open(path, "rb") as f:
+                data = tomllib.load(f)
+        else:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+    except ValueError as e:  # JSONDecodeError / TOMLDecodeError
+        raise ValueError(f"{path}: {e}") from None
+
+    entries = data.get("subjects") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise ValueError(f'{path}: expected a "subjects" list')
+    grades = {}
+    for i, entry in enumerate(entries, 1):
+        try:
+            code, label = entry["code"], entry["label"]
+            levels = entry["grade"] if isinstance(entry["grade"], list) else [entry["grade"]]
+            streams = entry.get("streams", [])
+            is_main = entry.get("is_main", True)
+            if (not re.fullmatch(r"\d{3}", code) or not label or not levels or set(levels) - {10, 12}
+                    or not all(stream and isinstance(stream, str) for stream in streams)):
+                raise ValueError
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError(f"{path}: subject {i} needs a 3-digit code, a label, grade 10 and/or 12 "
+                             f"and named streams") from None
+        for level in levels:
+            header_map, mains = grades.setdefault(level == 12, ({}, {}))
+            if code in header_map or label in header_map.values():
+                raise ValueError(f"{path}: subject {i} ({label}) is listed twice for Grade {level}")
+            header_map[code] = label
+            for stream in (streams if level == 12 else [""]):
+                subjects = mains.setdefault(stream, set())
+                if is_main:
+                    subjects.add(label)
+    return grades
+
+
+CATALOG_PATH = catalog_path()
+# A catalog that cannot be read must not stop the program at import: the built-in
+# maps are used and CATALOG_ERROR says why, for the CLI and the GUI to show
+CATALOG_ERROR = None
+try:
+    CATALOG = read_catalog(CATALOG_PATH) if CATALOG_PATH else {}
+except (OSError, ValueError, ImportError) as e:  # ImportError: subjects.toml before Python 3.11
+    CATALOG = {}
+    CATALOG_ERROR = str(e) if isinstance(e, ValueError) else f"{CATALOG_PATH}: {e}"
+if False in CATALOG:
+    GRADE10_SUBJECT_HEADER_MAP, MAIN_SUBJECTS_10 = CATALOG[False][0], CATALOG[False][1].get("", set())
+if True in CATALOG:
+    GRADE12_SUBJECT_HEADER_MAP, STREAMS_12 = CATALOG[True]
+
+# Subjects most streams share (ENG, IP, PHED) say nothing about the stream: a student
+# taking e.g. HIS, POL_SC, ECO and PHED would otherwise tie ARTS with COM
+SHARED_SUBJECTS_12 = {label for label in set().union(*STREAMS_12.values())
+                      if len(STREAMS_12) > 1 and 2 * sum(label in s for s in STREAMS_12.values()) > len(STREAMS_12)}
+STREAM_SUBJECTS_12 = {stream: subjects - SHARED_SUBJECTS_12 for stream, subjects in STREAMS_12.items()}
+# Stream codes stored per student; 0 is a student no stream could be given
+STREAM_NAMES = ("", *STREAMS_12)
+
+# -------------------------
+# Subject registry
+# -------------------------
+# Output columns around the subject columns
+STUDENT_COLUMNS = ("Roll No", "Gender", "Name")
+RESULT_COLUMNS = {
+    False: ("Result", "Main Total", "Main %", "Main % Rank", "Top 5 Total", "Top 5 %", "Top 5 % Rank"),
+    True: ("Result", "Total", "Percentage", "Rank",
+           "Stream", "Main Total", "Main %", "Main % Stream Rank", "Best 5 Total", "Best 5 %", "Best 5 % Stream Rank"),
+}
+
+
+class SubjectRegistry:
+    """Read-only lookup tables for one grade's subject map, built once at import.
+
+    A subject's slot is its position in the header map: its column in the
+    marks matrix and its place in the output. Subject sets are int
+    bitmasks over the slots (bit i = slot i); main_masks has one per
+    stream name ("" is no stream, the only one for Grade 10) and
+    stream_masks the subjects that tell the Grade 12 streams apart.
+    """
+
+    __slots__ = ("is_grade12", "codes", "labels", "slots", "main_masks", "stream_masks", "columns")
+
+    def __init__(self, is_grade12, header_map, main_subjects, stream_subjects=None):
+        init = object.__setattr__
+        init(self, "is_grade12", is_grade12)
+        init(self, "codes", tuple(header_map))
+        init(self, "labels", tuple(header_map.values()))
+        slots = {code: i for i, code in enumerate(header_map)}
+        slots.update({code.encode(): i for code, i in slots.items()})  # mmap reader codes are bytes
+        init(self, "slots", MappingProxyType(slots))
+        init(self, "main_masks", MappingProxyType({s: self.mask(labels) for s, labels in main_subjects.items()}))
+        init(self, "stream_masks",
+             MappingProxyType({s: self.mask(labels) for s, labels in (stream_subjects or {}).items()}))
+        init(self, "columns", STUDENT_COLUMNS + self.labels + RESULT_COLUMNS[is_grade12])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SubjectRegistry is read-only")
+
+    def mask(self, labels):
+        """Bitmask of the given subject labels (labels not in the map are ignored)."""
+        return sum(1 << slot for slot, label in enumerate(self.labels) if label in labels)
+
+    def code_mask(self, codes):
+        """Bitmask of the given subject codes (str or bytes)."""
+        mask = 0
+        for code in codes:
+            slot = self.slots.get(code)
+            if slot is not None:
+                mask |= 1 << slot
+        return mask
+
+    def flags(self, mask):
+        """mask as one bool per slot, e.g. for a numpy column mask."""
+        return tuple(bool(mask >> slot & 1) for slot in range(len(self.labels)))
+
+    def __reduce__(self):
+        # Pickled by grade (mapping proxies cannot be); worker processes build the same tables at import
+        return registry_for, (self.is_grade12,)
+
+
+SUBJECTS = {
+    False: SubjectRegistry(False, GRADE10_SUBJECT_HEADER_MAP, {"": MAIN_SUBJECTS_10}),
+    True: SubjectRegistry(True, GRADE12_SUBJECT_HEADER_MAP, {"": set(), **STREAMS_12}, STREAM_SUBJECTS_12),
+}
+
+
+def registry_for(is_grade12):
+    """SUBJECTS[is_grade12] (what a pickled SubjectRegistry loads as)."""
+    return SUBJECTS[is_grade12]
+
+
+# Code sets for telling the grades apart (041 etc. appear in both)
+GRADE_CODES = {grade: frozenset(registry.codes) for grade, registry in SUBJECTS.items()}
+COMMON_CODES = GRADE_CODES[False] & GRADE_CODES[True]
+GRADE_ONLY_CODES = {grade: codes - COMMON_CODES for grade, codes in GRADE_CODES.items()}
+SUBJECT_LABELS = frozenset(SUBJECTS[False].labels) | frozenset(SUBJECTS[True].labels)
+
+# -------------------------
+# Record tokenizer
+# -------------------------
+# Student line: roll no, gender, name, then subject codes (and maybe the result)
+STUDENT_LINE_RE = re.compile(r"^(\d{8})\s+([MF])\s+(.*?)\s+(\d{3})")
+CODE_TOKEN_RE = re.compile(r"\b(\d{3})\b|\b(PASS|FAIL|COMP|ABST)\b", re.I)
+# Marks line: "<marks> <grade>" pairs (and maybe the result)
+MARK_TOKEN_RE = re.compile(r"(\d{1,3})\s+([A-D][12]|E[12]?)\b|\b((?i:PASS|FAIL|COMP|ABST))\b")
+
+# Same patterns for undecoded lines (mmap reader)
+STUDENT_LINE_RE_B = re.compile(STUDENT_LINE_RE.pattern.encode())
+CODE_TOKEN_RE_B = re.compile(CODE_TOKEN_RE.pattern.encode(), re.I)
+MARK_TOKEN_RE_B = re.compile(MARK_TOKEN_RE.pattern.encode())
+
+
+ALIGN_TOLERANCE = 3  # columns a mark may sit left or right of the subject code printed above it
+
+
+def as_text(value):
+    """value as str (fields from the mmap reader are bytes)."""
+    return value.decode("utf-8", errors="ignore") if isinstance(value, bytes) else value
+
+
+def tokenize_record(head, line2, shift=0):
+    """Split a matched student line and its marks line into record fields.
+
+    Each line is scanned once; the result is taken from the student line
+    first and from the marks line otherwise. Works on str lines and on
+    undecoded bytes lines alike (fields then stay bytes).
+
+    Every mark belongs to the subject code printed above it: shift is the
+    marks line's indent minus the student line's, so the columns of both
+    lines can be compared. A record whose first and last marks sit under
+    its first and last codes is taken as is; any other goes through
+    align_record, which lists what it found in the returned issues.
+    """
+    if isinstance(line2, bytes):
+        code_re, mark_re, result = CODE_TOKEN_RE_B, MARK_TOKEN_RE_B, b""
+    else:
+        code_re, mark_re, result = CODE_TOKEN_RE, MARK_TOKEN_RE, ""
+
+    codes, line2_result = [], result
+    for code, res in code_re.findall(head.string):
+        if code:
+            codes.append(code)
+        elif not result:
+            result = res.upper()
+
+    marks, grades, raw = [], [], []
+    for mark, grade, res in mark_re.findall(line2):
+        if mark:
+            raw.append(mark)
+            grades.append(grade)
+        elif not line2_result:
+            line2_result = res.upper()
+    marks = [int(mark) for mark in raw]
+
+    name, issues = head.group(3).strip(), []
+    if len(codes) != len(marks) or (codes and (
+            abs(head.start(4) - line2.find(raw[0]) - shift) > ALIGN_TOLERANCE
+            or abs(head.string.rfind(codes[-1]) - line2.rfind(raw[-1]) - shift) > ALIGN_TOLERANCE
+            or max(marks) > 100)):
+        name, codes, marks, grades, issues = align_record(head, line2, shift)
+    result = result or line2_result
+    if not result:
+        issues.append("no result (PASS/FAIL/COMP/ABST)")
+    return head.group(1), head.group(2), name, codes, marks, grades, result, issues
+
+
+def align_record(head, line2, shift=0):
+    """Pair marks with subject codes by column; the slow path of tokenize_record.
+
+    A 3-digit number in the name or an extra code no longer shifts the
+    marks after it onto the wrong subjects: such tokens are left out and
+    reported. If no mark lines up with any code (the layout was lost,
+    e.g. re-flowed or tab-separated text) marks are paired in order.
+    Returns (name, codes, marks, grades, issues) with codes/marks/grades
+    paired one to one.
+    """
+    code_re, mark_re = (CODE_TOKEN_RE_B, MARK_TOKEN_RE_B) if isinstance(line2, bytes) else \
+        (CODE_TOKEN_RE, MARK_TOKEN_RE)
+    codes, code_cols = [], []
+    for token in code_re.finditer(head.string):
+        if token[1]:
+            codes.append(token[1])
+            code_cols.append(token.start())
+    marks, grades, mark_cols = [], [], []
+    for token in mark_re.finditer(line2):
+        if token[1]:
+            marks.append(int(token[1]))
+            grades.append(token[2])
+            mark_cols.append(token.start() + shift)
+
+    issues = [] if line2 else ["no marks line below the student line"]
+    paired = {}  # code index -> mark index
+    for j, col in enumerate(mark_cols):
+        k = min(range(len(codes)), key=lambda k: abs(code_cols[k] - col), default=None)
+        if k is not None and k not in paired and abs(code_cols[k] - col) <= ALIGN_TOLERANCE:
+            paired[k] = j
+
+    # Marks never sit under the name in a gazette; if they do, the columns mean nothing
+    if not paired or (codes and mark_cols[0] < code_cols[0] - ALIGN_TOLERANCE):
+        paired = {}
+        if line2 and len(codes) != len(marks):
+            issues.append(f"{len(codes)} subject codes but {len(marks)} marks, paired in order")
+        paired.update((k, k) for k in range(min(len(codes), len(marks))))
+    else:
+        first = min(paired)
+        for k, code in enumerate(codes):
+            if k < first:
+                issues.append(f"number {as_text(code)} in the name")
+            elif k not in paired:
+                issues.append(f"subject code {as_text(code)} has no mark below it")
+        taken = set(paired.values())
+        for j, mark in enumerate(marks):
+            if j not in taken:
+                issues.append(f"mark {mark} {as_text(grades[j])} is under no subject code")
+
+    # The name runs up to the first subject code that has a mark
+    name = head.group(3).strip()
+    if paired and code_cols[min(paired)] != head.start(4):
+        name = head.string[head.start(3):code_cols[min(paired)]].strip()
+        issues.append(f"name read as {as_text(name)!r}")
+
+    order = sorted(paired)
+    for k in order:
+        if marks[paired[k]] > 100:
+            issues.append(f"mark {marks[paired[k]]} for subject code {as_text(codes[k])} is over 100")
+    return (name, [codes[k] for k in order], [marks[paired[k]] for k in order],
+            [grades[paired[k]] for k in order], issues)
+
+
+# -------------------------
+# Gazette reader
+# -------------------------
+def iter_record_lines(lines, student_line_re=STUDENT_LINE_RE):
+    """Pair every student line (8-digit roll no) with the marks line after it.
+
+    Yields (match, marks_line, line_no, shift) where match is the
+    student_line_re match, line_no the 1-based number of the student line
+    among `lines` and shift the marks line's indent minus the student
+    line's (see tokenize_record). Lines are stripped. A student line
+    followed by another student line, or by nothing, gets an empty marks line.
+    """
+    pending = None
+    for line_no, line in enumerate(lines, 1):
+        text = line.lstrip()
+        if not text:
+            continue
+        indent = len(line) - len(text)
+        text = text.rstrip()
+        head = student_line_re.match(text)
+        if pending is not None:
+            if head is None:
+                yield pending, text, pending_no, indent - pending_indent
+                pending = None
+                continue
+            yield pending, text[:0], pending_no, 0  # student line without a marks line
+        pending, pending_no, pending_indent = head, line_no, indent
+    if pending is not None:
+        # The last line was a student line (ranges never end on one, see find_record_boundaries)
+        yield pending, text[:0], pending_no, 0
+
+
+def iter_file_lines(path, start=0, end=None):
+    """Yield the decoded lines of a file whose first byte lies in [start, end)."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+        for raw in f:
+            if end is not None and pos >= end:
+                break
+            pos += len(raw)
+            yield raw.decode("utf-8", errors="ignore")
+
+
+def iter_mmap_lines(path, start=0, end=None):
+    """Yield the raw byte lines of a memory-mapped file in [start, end).
+
+    Nothing is decoded; lines are sliced straight out of the mapping.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = size if end is None else min(end, size)
+            pos = start
+            while pos < end:
+                nl = mm.find(b"\n", pos)
+                nxt = size if nl < 0 else nl + 1
+                yield mm[pos:nxt]
+                pos = nxt
+
+
+# reader name -> (line source, student line pattern)
+READERS = {
+    "text": (iter_file_lines, STUDENT_LINE_RE),
+    "mmap": (iter_mmap_lines, STUDENT_LINE_RE_B),
+}
+
+
+# -------------------------
+# First-record sniffing
+# -------------------------
+SNIFF_BYTES = 256 * 1024  # how far into the file the first student line is looked for
+FIRST_LINE_RE_B = re.compile(rb"^\d{8}\s")
+SUBJECT_CODE_RE = re.compile(r"\b\d{3}\b")
+
+
+class FirstRecord:
+    """The first student line of a gazette, found by sniff_first_record.
+
+    offset is where the line starts, so parsing can begin there instead
+    of reading the preamble again.
+    """
+
+    __slots__ = ("offset", "line", "codes")
+
+    def __init__(self, offset, line, codes):
+        self.offset = offset
+        self.line = line
+        self.codes = codes
+
+
+def detect_grade(codes):
+    """True (Grade 12) / False (Grade 10) from subject codes, None if unclear."""
+    grade10 = bool(codes & GRADE_ONLY_CODES[False])
+    grade12 = bool(codes & GRADE_ONLY_CODES[True])
+    if grade10 == grade12:
+        return None
+    return grade12
+
+
+def sniff_first_record(path, limit=SNIFF_BYTES):
+    """Find the first student line within the first `limit` bytes of a gazette.
+
+    Only one bounded read is done, so this takes the same time for any
+    file size. Returns a FirstRecord, or None if no student line is found
+    in that window.
+    """
+    with open(path, "rb") as f:
+        data = f.read(limit)
+        at_end = not f.read(1)
+    offset = 0
+    for raw in data.splitlines(keepends=True):
+        if not at_end and offset + len(raw) == len(data) and not raw.endswith(b"\n"):
+            break  # cut off by the read limit
+        line = raw.strip()
+        if FIRST_LINE_RE_B.match(line):
+            text = line.decode("utf-8", errors="ignore")
+            return FirstRecord(offset, text, set(SUBJECT_CODE_RE.findall(text)))
+        offset += len(raw)
+    return None
+
+
+# -------------------------
+# Grade / stream classification
+# -------------------------
+CLASSIFY_RECORDS = 200  # students looked at by classify_gazette
+MIN_CONFIDENCE = 0.9  # share of those students that must agree for an unattended run
+
+
+def student_stream(mask):
+    """Grade 12 stream whose own main subjects the student takes most of.
+
+    mask is the student's SUBJECTS[True] bitmask. Returns None when no
+    stream subject is taken or two streams tie (e.g. PCMB).
+    """
+    counts = sorted((((mask & subjects).bit_count(), stream)
+                     for stream, subjects in SUBJECTS[True].stream_masks.items()), reverse=True)
+    (best, stream), (second, _) = (counts + [(0, None)] * 2)[:2]  # a catalog may have fewer than 2 streams
+    return stream if best and best > second else None
+
+
+class Classification:
+    """Grade and stream of a gazette, inferred from its first students.
+
+    confidence is the share of the sampled students that agree with
+    is_grade12 (None when no student could be placed). For Grade 12,
+    stream is the stream of at least MIN_CONFIDENCE of the students, or
+    "MIXED"; streams counts every sampled student's stream.
+    """
+
+    __slots__ = ("first", "records", "is_grade12", "confidence", "stream", "streams")
+
+    def __init__(self, first, records, is_grade12, confidence, stream, streams):
+        self.first = first
+        self.records = records
+        self.is_grade12 = is_grade12
+        self.confidence = confidence
+        self.stream = stream
+        self.streams = streams
+
+    @property
+    def confident(self):
+        """True when the grade is safe to use without asking anyone."""
+        return self.is_grade12 is not None and self.confidence >= MIN_CONFIDENCE
+
+    @property
+    def grade_text(self):
+        return {None: "unknown grade", False: "Grade 10", True: "Grade 12"}[self.is_grade12]
+
+
+def classify_gazette(path, records=CLASSIFY_RECORDS):
+    """Infer grade (and Grade 12 stream) from the first `records` students.
+
+    Each student votes with detect_grade on its subject codes. Returns a
+    Classification, or None if the file has no student line near the start.
+    """
+    first = sniff_first_record(path)
+    if first is None:
+        return None
+    grades, streams, seen = Counter(), Counter(), 0
+    for _, _, _, codes, *_ in islice(iter_student_records(path, first.offset), records):
+        seen += 1
+        codes = set(codes)
+        grade = detect_grade(codes)
+        if grade is not None:
+            grades[grade] += 1
+        if grade is not False:
+            streams[student_stream(SUBJECTS[True].code_mask(codes))] += 1
+    if not grades:
+        return Classification(first, seen, None, 0.0, None, {})
+    is_grade12, votes = grades.most_common(1)[0]
+    stream = None
+    if is_grade12:
+        top, count = max(((s, n) for s, n in streams.items() if s), key=lambda item: item[1], default=(None, 0))
+        stream = top if count >= MIN_CONFIDENCE * seen else "MIXED"
+    return Classification(first, seen, is_grade12, votes / seen, stream,
+                          dict(streams) if is_grade12 else {})
+
+
+def iter_student_records(path, start=0, end=None, reader="text"):
+    """Stream a gazette TXT file and yield one record per student.
+
+    Each record is (roll, gender, name, codes, marks, grades, result, issues),
+    issues listing what did not line up (see align_record). Only
+    the current pair of lines is held in memory, so the file size does not matter.
+    start/end restrict parsing to a byte range (see find_record_boundaries).
+    With reader="mmap" the fields are undecoded bytes.
+    """
+    iter_lines, student_line_re = READERS[reader]
+    for head, line2, _, shift in iter_record_lines(iter_lines(path, start, end), student_line_re):
+        yield tokenize_record(head, line2, shift)
+
+
+# -------------------------
+# Columnar record builder
+# -------------------------
+PARSER_VERSION = 5  # bump whenever parsed output changes; invalidates cached parses
+ABSENT_MARK = 255  # uint8 sentinel for a subject the student did not take
+RESULT_CODES = ("", "PASS", "FAIL", "COMP", "ABST")
+RESULT_INDEX = {res: i for i, res in enumerate(RESULT_CODES)}
+RESULT_INDEX.update({res.encode(): i for res, i in RESULT_INDEX.items()})
+# Subject grades, stored as one code byte per subject slot (0: not taken)
+SUBJECT_GRADES = ("", "A1", "A2", "B1", "B2", "C1", "C2", "D1", "D2", "E", "E1", "E2")
+GRADE_INDEX = {grade: i for i, grade in enumerate(SUBJECT_GRADES)}
+GRADE_INDEX.update({grade.encode(): i for grade, i in GRADE_INDEX.items()})
+
+
+def grade_col_for(label):
+    """Output column holding the grade of subject `label`."""
+    return f"{label}-G"
+
+
+class Result(IntEnum):
+    """Result of a student; the value is its code in RESULT_CODES."""
+
+    NONE = 0
+    PASS = 1
+    FAIL = 2
+    COMP = 3
+    ABST = 4
+
+    def __str__(self):
+        return RESULT_CODES[self]
+
+
+class StudentRecord:
+    """One student as a compact object (see ResultColumns.__getitem__).
+
+    The roll number is an int, the gender a single byte and the marks and
+    grades one byte per subject slot of the header map (ABSENT_MARK and
+    grade code 0 when not taken). `labels` is the header map's label list,
+    shared by every record.
+    """
+
+    __slots__ = ("roll", "gender", "name", "marks", "grades", "result", "labels")
+
+    def __init__(self, roll, gender, name, marks, grades, result, labels):
+        self.roll = roll
+        self.gender = gender
+        self.name = name
+        self.marks = marks
+        self.grades = grades
+        self.result = result
+        self.labels = labels
+
+    @property
+    def roll_no(self):
+        return f"{self.roll:08d}"
+
+    def subject_marks(self):
+        """{subject label: mark} for the subjects the student took."""
+        return {self.labels[slot]: mark for slot, mark in enumerate(self.marks) if mark != ABSENT_MARK}
+
+    def subject_grades(self):
+        """{subject label: grade} for the subjects with a grade."""
+        return {self.labels[slot]: SUBJECT_GRADES[code] for slot, code in enumerate(self.grades) if code}
+
+    def __repr__(self):
+        return f"StudentRecord({self.roll_no}, {chr(self.gender)}, {self.result})"
+
+
+class ResultColumns:
+    """Column-wise store of the students parsed from one gazette.
+
+    Marks live in a single flat uint8 buffer with one slot per subject of
+    the header map, so no per-student dict is built while parsing; grades
+    (SUBJECT_GRADES codes) sit in a second buffer with the same layout. Records
+    from the mmap reader are stored undecoded; names are decoded only when
+    the columns are emitted. issues holds (roll, line, reason) for every
+    record that did not parse cleanly (see tokenize_record).
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.labels = registry.labels
+        self.blank_row = bytes([ABSENT_MARK]) * len(self.labels)
+        self.blank_grades = bytes(len(self.labels))
+        self.rolls = array("L")
+        self.genders = bytearray()
+        self.names = []
+        self.results = bytearray()
+        self.marks = bytearray()
+        self.grades = bytearray()
+        self.issues = []
+
+    def __len__(self):
+        return len(self.rolls)
+
+    def __getitem__(self, i):
+        """Student i as a StudentRecord (marks and grades are copies of the row)."""
+        width = len(self.labels)
+        i = range(len(self))[i]
+        name = self.names[i]
+        row = slice(i * width, (i + 1) * width)
+        return StudentRecord(self.rolls[i], self.genders[i],
+                             name.decode("utf-8", errors="ignore") if isinstance(name, bytes) else name,
+                             bytes(self.marks[row]), bytes(self.grades[row]), Result(self.results[i]), self.labels)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def add(self, roll, gender, name, codes, marks, grades, result):
+        """Append one student; marks and their grades are paired with codes in order.
+
+        Returns the codes that are not in the header map (their marks are dropped).
+        """
+        self.rolls.append(int(roll))
+        self.genders.append(ord(gender))
+        self.names.append(name)
+        self.results.append(RESULT_INDEX[result])
+
+        base = len(self.marks)
+        self.marks += self.blank_row
+        self.grades += self.blank_grades
+        slots = self.registry.slots
+        unknown = []
+        for code, mark, grade in zip(codes, marks, grades):
+            slot = slots.get(code)
+            if slot is None:
+                unknown.append(code)
+            elif mark < ABSENT_MARK:
+                self.marks[base + slot] = mark
+                self.grades[base + slot] = GRADE_INDEX[grade]
+        return unknown
+
+    def extend(self, other):
+        """Append all students of another ResultColumns with the same header map."""
+        self.rolls.extend(other.rolls)
+        self.genders += other.genders
+        self.names.extend(other.names)
+        self.results += other.results
+        self.marks += other.marks
+        self.grades += other.grades
+        self.issues += other.issues
+
+    def shift_issues(self, lines):
+        """Add `lines` to the issue line numbers, for a range parsed from mid-file."""
+        self.issues = [(roll, line + lines, reason) for roll, line, reason in self.issues]
+
+    def to_arrays(self):
+        """The stored columns as plain numpy arrays, e.g. for np.savez (see from_arrays)."""
+        import numpy as np
+
+        names = "\n".join(name.decode("utf-8", errors="ignore") if isinstance(name, bytes) else name
+                          for name in self.names)
+        issue_rolls, issue_lines, reasons = zip(*self.issues) if self.issues else ((), (), ())
+        return {
+            "labels": np.array(self.labels),
+            "rolls": np.array(self.rolls, dtype=np.uint32),
+            "genders": np.frombuffer(self.genders, dtype=np.uint8),
+            "names": np.frombuffer(names.encode("utf-8"), dtype=np.uint8),
+            "results": np.frombuffer(self.results, dtype=np.uint8),
+            "marks": self.marks_matrix(),
+            "grades": self.grades_matrix(),
+            "issue_rolls": np.array(issue_rolls, dtype=np.uint32),
+            "issue_lines": np.array(issue_lines, dtype=np.uint32),
+            "issue_reasons": np.frombuffer("\n".join(reasons).encode("utf-8"), dtype=np.uint8),
+        }
+
+    @classmethod
+    def from_arrays(cls, registry, arrays):
+        """Rebuild ResultColumns from the output of to_arrays().
+
+        Subjects saved in another slot order are moved to the registry's.
+        """
+        columns = cls(registry)
+        saved = list(arrays["labels"])
+        if sorted(saved) != sorted(columns.labels):
+            raise ValueError("Saved results use a different subject map.")
+        order = [saved.index(label) for label in columns.labels]
+        columns.rolls = array("L", arrays["rolls"].tolist())
+        columns.genders = bytearray(arrays["genders"].tobytes())
+        columns.names = arrays["names"].tobytes().decode("utf-8").split("\n") if len(columns.rolls) else []
+        columns.results = bytearray(arrays["results"].tobytes())
+        columns.marks = bytearray(arrays["marks"][:, order].tobytes())
+        # Snapshots saved before grades were kept have none
+        columns.grades = bytearray(arrays["grades"][:, order].tobytes()) if "grades" in arrays else \
+            bytearray(len(columns.marks))
+        if "issue_rolls" in arrays and len(arrays["issue_rolls"]):
+            reasons = arrays["issue_reasons"].tobytes().decode("utf-8").split("\n")
+            columns.issues = list(zip(arrays["issue_rolls"].tolist(), arrays["issue_lines"].tolist(), reasons))
+        return columns
+
+    def marks_matrix(self):
+        """Students x subjects uint8 view of the marks (no copy)."""
+        import numpy as np
+
+        return np.frombuffer(self.marks, dtype=np.uint8).reshape(len(self), len(self.labels))
+
+    def used_slots(self):
+        """Slots (ascending) of the subjects at least one student took."""
+        import numpy as np
+
+        return np.flatnonzero((self.marks_matrix() != ABSENT_MARK).any(axis=0))
+
+    def grades_matrix(self):
+        """Students x subjects uint8 view of the grade codes (no copy)."""
+        import numpy as np
+
+        return np.frombuffer(self.grades, dtype=np.uint8).reshape(len(self), len(self.labels))
+
+    def to_columns(self):
+        """Return {column name: preallocated column} for the parsed fields.
+
+        Subjects nobody took are left out, like the old dict-based rows.
+        Each subject also gets a categorical grade_col_for(label) column.
+        """
+        import numpy as np
+        import pandas as pd
+
+        n = len(self)
+        columns = {
+            "Roll No": [f"{roll:08d}" for roll in self.rolls],
+            "Gender": np.frombuffer(self.genders, dtype="S1").astype("U1"),
+            "Name": [name.decode("utf-8", errors="ignore") if isinstance(name, bytes) else name
+                     for name in self.names],
+            "Result": pd.Categorical.from_codes(np.frombuffer(self.results, dtype=np.uint8), RESULT_CODES),
+        }
+        matrix = self.marks_matrix()
+        grades = self.grades_matrix()
+        for slot in self.used_slots().tolist() if n else ():
+            label = self.labels[slot]
+            columns[label] = pd.arrays.IntegerArray(matrix[:, slot].copy(), matrix[:, slot] == ABSENT_MARK)
+            # code 0 (no grade) becomes NaN
+            columns[grade_col_for(label)] = pd.Categorical.from_codes(grades[:, slot].astype(np.int8) - 1,
+                                                                      SUBJECT_GRADES[1:])
+        return columns
+
+
+# -------------------------
+# Parallel parsing
+# -------------------------
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024  # smaller files parse faster in one process
+PROGRESS_STEPS = 50  # file ranges parsed one after another when progress is reported
+
+
+class Cancelled(Exception):
+    """Raised by a progress callback to stop a conversion."""
+
+
+def report(progress, stage, done, total):
+    """Send a progress event if a callback was given.
+
+    The callback is called as progress(stage, done, total) with stage
+    "read" (bytes), "parsed" (records, total None) or "written" (rows).
+    It may raise Cancelled to abort the conversion.
+    """
+    if progress is not None:
+        progress(stage, done, total)
+
+
+def find_record_boundaries(path, parts, start=0):
+    """Split a gazette into up to `parts` byte ranges on student-record boundaries.
+
+    A range only starts at a student line whose previous line is not a
+    student line, so no marks line is ever separated from its student and
+    each range parses exactly as it would inside the whole file.
+    Returns the sorted offsets, starting with `start` and ending with the file size.
+    """
+    size = os.path.getsize(path)
+    bounds = [start]
+    with open(path, "rb") as f:
+        for k in range(1, parts):
+            target = max(start + (size - start) * k // parts, bounds[-1])
+            f.seek(target)
+            pos = target + len(f.readline())  # skip the partial line
+            prev_is_student = True  # unknown, so never cut before the first full line
+            cut = size
+            for raw in f:
+                line = raw.strip()
+                if line:
+                    is_student = STUDENT_LINE_RE.match(line.decode("utf-8", errors="ignore")) is not None
+                    if is_student and not prev_is_student:
+                        cut = pos
+                        break
+                    prev_is_student = is_student
+                pos += len(raw)
+            if cut > bounds[-1]:
+                bounds.append(cut)
+    if bounds[-1] < size:
+        bounds.append(size)
+    return bounds
+
+
+def count_lines(path, start, end):
+    """Number of line breaks in the byte range [start, end) of a file."""
+    count = 0
+    with open(path, "rb") as f:
+        f.seek(start)
+        left = end - start
+        while left > 0:
+            block = f.read(min(left, 1024 * 1024))
+            if not block:
+                break
+            count += block.count(b"\n")
+            left -= len(block)
+    return count
+
+
+def parse_range(path, is_grade12, start=0, end=None, reader="text"):
+    """Parse the students in one byte range of a gazette into ResultColumns.
+
+    Issue line numbers count from the start of the range (see shift_issues).
+    """
+    columns = ResultColumns(SUBJECTS[is_grade12])
+    iter_lines, student_line_re = READERS[reader]
+    for head, line2, line, shift in iter_record_lines(iter_lines(path, start, end), student_line_re):
+        roll, gender, name, codes, marks, grades, result, issues = tokenize_record(head, line2, shift)
+        unknown = columns.add(roll, gender, name, codes, marks, grades, result)
+        if issues or unknown:
+            issues += [f"unknown subject code {as_text(code)}, mark dropped" for code in unknown]
+            columns.issues += [(int(roll), line, reason) for reason in issues]
+    return columns
+
+
+def parse_gazette(path, is_grade12, workers=1, reader="text", progress=None, start=0):
+    """Parse a whole gazette, split across `workers` processes when > 1.
+
+    Chunks are merged in file order, so the result is identical to the
+    serial parse. reader is "text" (decode every line) or "mmap" (bytes
+    regexes on a memory-mapped file). See report() for `progress`.
+    start skips the preamble, e.g. the offset of sniff_first_record().
+    Issue line numbers are line numbers in the whole file.
+    """
+    if workers <= 1 and progress is None:
+        columns = parse_range(path, is_grade12, start, reader=reader)
+        if columns.issues and start:
+            columns.shift_issues(count_lines(path, 0, start))
+        return columns
+
+    # With a progress callback the serial parse also runs range by range
+    bounds = find_record_boundaries(path, max(workers * 4, PROGRESS_STEPS if progress else 0), start)
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        if pool:
+            parts = pool.map(parse_range, repeat(path), repeat(is_grade12), bounds[:-1], bounds[1:], repeat(reader))
+        else:
+            parts = (parse_range(path, is_grade12, start, end, reader) for start, end in zip(bounds, bounds[1:]))
+        columns = ResultColumns(SUBJECTS[is_grade12])
+        lines, counted = 0, 0  # line breaks before byte `counted`, only counted once an issue needs them
+        for begin, end, part in zip(bounds, bounds[1:], parts):
+            if part.issues:
+                lines += count_lines(path, counted, begin)
+                counted = begin
+                part.shift_issues(lines)
+            columns.extend(part)
+            report(progress, "read", end, bounds[-1])
+            report(progress, "parsed", len(columns), None)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    return columns
+
+
+# -------------------------
+# Totals and ranks
+# -------------------------
+def dense_rank(values):
+    """Dense rank, highest value first (same as pandas rank(method="dense"))."""
+    import numpy as np
+
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return len(uniques) - inverse
+
+
+def grouped_dense_rank(values, groups):
+    """Dense rank of values within each group, highest first, in one sort.
+
+    Same as groupby(groups)[values].rank(method="dense", ascending=False),
+    but without a pass per group.
+    """
+    import numpy as np
+
+    if not len(values):
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((-values, groups))
+    v, g = values[order], groups[order]
+    new_group = np.r_[True, g[1:] != g[:-1]]
+    new_value = new_group | np.r_[True, v[1:] != v[:-1]]
+    distinct = np.cumsum(new_value)
+    group_start = np.maximum.accumulate(np.where(new_group, distinct, 0))
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = distinct - group_start + 1
+    return ranks
+
+
+def student_streams(taken, used=None):
+    """Stream code (index into STREAM_NAMES) of every Grade 12 student, vectorized student_stream.
+
+    used is the bool mask of subject slots kept in `taken` (all by default).
+    """
+    import numpy as np
+
+    registry = SUBJECTS[True]
+    masks = np.array([registry.flags(registry.stream_masks[stream]) for stream in STREAMS_12],
+                     dtype=np.int32).reshape(len(STREAMS_12), len(registry.labels))
+    if used is not None:
+        masks = masks[:, used]
+    # Two zero columns stand in for missing streams and never win
+    counts = np.c_[taken.astype(np.int32) @ masks.T, np.zeros((len(taken), 2), dtype=np.int32)]
+    ordered = np.sort(counts, axis=1)
+    best, second = ordered[:, -1], ordered[:, -2]
+    return np.where((best > 0) & (best > second), counts.argmax(axis=1) + 1, 0).astype(np.uint8)
+
+
+def compute_metrics(matrix, is_grade12):
+    """Totals and percentages for every student at once from the marks matrix.
+
+    Absent subjects are masked out of sums and means; a student with no
+    marks gets 0. Returns {column name: array}.
+    """
+    import numpy as np
+
+    registry = SUBJECTS[is_grade12]
+    taken = matrix != ABSENT_MARK
+    # Only the subjects someone took, so a large subject catalog costs nothing here
+    used = taken.any(axis=0)
+    taken, matrix = taken[:, used], matrix[:, used]
+    marks = np.where(taken, matrix, 0).astype(np.int64)
+
+    def mean_of(total, count):
+        return np.round(np.divide(total, count, out=np.zeros(len(total)), where=count > 0), 2)
+
+    def top5_of(marks):
+        # Absent (and left out) subjects count as 0, so the top 5 of the row is the top 5 taken
+        k = min(5, marks.shape[1])
+        return np.partition(marks, marks.shape[1] - k, axis=1)[:, -k:].sum(axis=1)
+
+    if is_grade12:
+        total = marks.sum(axis=1)
+        # Main subjects follow each student's stream (none for an unknown stream)
+        stream = student_streams(taken, used)
+        main_masks = np.array([registry.flags(registry.main_masks[s]) for s in STREAM_NAMES])[:, used]
+        main = main_masks[stream] & taken
+        main_marks = marks * main
+        main_total = main_marks.sum(axis=1)
+        best5_total = top5_of(main_marks)  # best 5 of the stream's main subjects
+        return {
+            "Total": total,
+            "Percentage": mean_of(total, taken.sum(axis=1)),
+            "Stream": stream,
+            "Main Total": main_total,
+            "Main %": mean_of(main_total, main.sum(axis=1)),
+            "Best 5 Total": best5_total,
+            "Best 5 %": np.round(best5_total / 5, 2),
+        }
+
+    top5_total = top5_of(marks)
+    main = np.array(registry.flags(registry.main_masks[""]))[used]
+    main_total = marks[:, main].sum(axis=1)
+    return {
+        "Main Total": main_total,
+        "Main %": mean_of(main_total, taken[:, main].sum(axis=1)),
+        "Top 5 Total": top5_total,
+        "Top 5 %": np.round(top5_total / 5, 2),
+    }
+
+
+# (metric, rank column) pairs ranked for each grade
+RANKED_METRICS = {
+    False: (("Main %", "Main % Rank"), ("Top 5 %", "Top 5 % Rank")),
+    True: (("Percentage", "Rank"),),
+}
+# (metric, rank column) pairs ranked within each stream
+STREAM_RANKED_METRICS = {
+    False: (),
+    True: (("Main %", "Main % Stream Rank"), ("Best 5 %", "Best 5 % Stream Rank")),
+}
+# Grade 12 columns that need a stream, left empty for students without one (e.g. PCMB)
+STREAM_ONLY_COLUMNS = ("Main Total", "Main %", "Main % Stream Rank", "Best 5 Total", "Best 5 %",
+                       "Best 5 % Stream Rank")
+
+
+def stream_ranks(metrics, is_grade12):
+    """Add the per-stream dense rank columns to metrics (in place).
+
+    Students without a stream (code 0) are not ranked; their rank is 0.
+    """
+    import numpy as np
+
+    for metric, rank in STREAM_RANKED_METRICS[is_grade12]:
+        known = metrics["Stream"] != 0
+        ranks = np.zeros(len(known), dtype=np.int64)
+        ranks[known] = grouped_dense_rank(metrics[metric][known], metrics["Stream"][known])
+        metrics[rank] = ranks
+
+
+def result_metrics(columns, is_grade12):
+    """compute_metrics plus the dense rank columns for the whole cohort."""
+    metrics = compute_metrics(columns.marks_matrix(), is_grade12)
+    for metric, rank in RANKED_METRICS[is_grade12]:
+        metrics[rank] = dense_rank(metrics[metric])
+    stream_ranks(metrics, is_grade12)
+    return metrics
+
+
+def build_result_frame(columns, is_grade12, metrics=None, grade_columns=False):
+    """Build the output DataFrame (marks, totals, ranks) from parsed columns.
+
+    metrics (from result_metrics) is computed when not given. With
+    grade_columns, every subject column is followed by its grade column.
+    """
+    import pandas as pd
+
+    if not len(columns):
+        return pd.DataFrame()
+
+    data = columns.to_columns()
+    data.update(result_metrics(columns, is_grade12) if metrics is None else metrics)
+    if "Stream" in data:
+        # No stream, no main subjects: empty cells instead of a 0 total and a rank among the unplaced
+        no_stream = data["Stream"] == 0
+        for col in STREAM_ONLY_COLUMNS:
+            values = pd.Series(data[col])
+            data[col] = (values.astype("Int64") if values.dtype.kind in "iu" else values).mask(no_stream)
+        data["Stream"] = pd.Categorical.from_codes(data["Stream"], STREAM_NAMES)
+    final_cols = SUBJECTS[is_grade12].columns
+    if grade_columns:
+        final_cols = [name for col in final_cols
+                      for name in ((col, grade_col_for(col)) if col in SUBJECT_LABELS else (col,))]
+    return pd.DataFrame({c: data[c] for c in final_cols if c in data})
+
+
+ISSUE_COLUMNS = ["Roll No", "Line", "Issue"]
+
+
+def build_issues_frame(columns):
+    """The records that did not parse cleanly, one row per issue in file order.
+
+    Empty (no rows) when every record lined up; written as the "Issues" sheet.
+    """
+    import pandas as pd
+
+    issues = sorted(columns.issues, key=lambda issue: issue[1])
+    return pd.DataFrame({"Roll No": [f"{roll:08d}" for roll, _, _ in issues],
+                         "Line": [line for _, line, _ in issues],
+                         "Issue": [reason for _, _, reason in issues]}, columns=ISSUE_COLUMNS)
+
+
+def issue_sheets(columns):
+    """{"Issues": DataFrame} for write_output's extra_sheets, {} if there are none."""
+    return {"Issues": build_issues_frame(columns)} if columns.issues else {}
+
+
+# -------------------------
+# Snapshots
+# -------------------------
+def save_snapshot(path, columns, metrics):
+    """Save parsed columns with their totals and ranks to an .npz snapshot.
+
+    A snapshot is the starting point for result_update (supplementary results).
+    """
+    import numpy as np
+
+    arrays = columns.to_arrays()
+    arrays.update({"metric:" + name: values for name, values in metrics.items()})
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+
+
+def load_snapshot(path, is_grade12):
+    """Load (columns, metrics) saved by save_snapshot."""
+    import numpy as np
+
+    with np.load(path, allow_pickle=False) as arrays:
+        columns = ResultColumns.from_arrays(SUBJECTS[is_grade12], arrays)
+        metrics = {name[len("metric:"):]: arrays[name] for name in arrays.files if name.startswith("metric:")}
+    ranked = RANKED_METRICS[is_grade12] + STREAM_RANKED_METRICS[is_grade12]
+    if not all(rank in metrics for _, rank in ranked):
+        metrics = result_metrics(columns, is_grade12)  # saved before some columns existed
+    return columns, metrics
+
+
+# -------------------------
+# Excel output
+# -------------------------
+PROGRESS_ROWS = 5000  # report written rows every this many rows
+
+
+# Mark bands (lowest mark, label) counted on the Summary sheet, highest first
+MARK_BANDS = ((91, "A1 (91-100)"), (81, "A2 (81-90)"), (71, "B1 (71-80)"), (61, "B2 (61-70)"), (51, "C1 (51-60)"),
+              (41, "C2 (41-50)"), (33, "D1 (33-40)"), (21, "D2 (21-32)"), (0, "E (0-20)"))
+SUMMARY_PERCENTILES = ((25, "25th Percentile"), (50, "Median"), (75, "75th Percentile"), (90, "90th Percentile"))
+HISTOGRAM_ROWS = 65536  # students per bincount block, bounds the index array
+
+
+def marks_histogram(matrix, groups=None, n_groups=1, bins=256):
+    """Count of every value per subject in one pass over a students x subjects matrix.
+
+    Returns a (n_groups, subjects, bins) array: [g, s, v] is how many
+    students of group g have value v in subject s. groups gives each
+    student's group index (all in group 0 when None). For the marks
+    matrix, column ABSENT_MARK counts the absent students; it also counts
+    grade codes (bins=len(SUBJECT_GRADES)).
+    """
+    import numpy as np
+
+    width = matrix.shape[1]
+    offsets = np.arange(width, dtype=np.intp) * bins
+    counts = np.zeros(n_groups * width * bins, dtype=np.int64)
+    for start in range(0, len(matrix), HISTOGRAM_ROWS):
+        block = matrix[start:start + HISTOGRAM_ROWS].astype(np.intp) + offsets
+        if groups is not None:
+            block += groups[start:start + HISTOGRAM_ROWS, None].astype(np.intp) * (width * bins)
+        counts += np.bincount(block.ravel(), minlength=n_groups * width * bins)
+    return counts.reshape(n_groups, width, bins)
+
+
+class SubjectAggregate:
+    """Mergeable statistics of one subject's marks.
+
+    Adding two aggregates gives the aggregate of both groups of students,
+    so school summaries combine into cluster or multi-year ones without
+    the gazettes. histogram[v] is the number of students who scored v,
+    grades[c] the number with grade SUBJECT_GRADES[c].
+    """
+
+    __slots__ = ("count", "total", "squares", "lowest", "highest", "distinction", "centum", "histogram", "grades")
+
+    def __init__(self, count, total, squares, lowest, highest, distinction, centum, histogram, grades):
+        self.count = count
+        self.total = total
+        self.squares = squares
+        self.lowest = lowest
+        self.highest = highest
+        self.distinction = distinction
+        self.centum = centum
+        self.histogram = histogram
+        self.grades = grades
+
+    @classmethod
+    def from_histogram(cls, histogram, grades):
+        import numpy as np
+
+        scored = np.nonzero(histogram)[0]
+        histogram = np.asarray(histogram[:scored[-1] + 1], dtype=np.int64)
+        values = np.arange(len(histogram), dtype=np.int64)
+        return cls(int(histogram.sum()), int(histogram @ values), int(histogram @ values ** 2),
+                   int(scored[0]), int(scored[-1]), int(histogram[75:].sum()), int(histogram[100:101].sum()),
+                   histogram, np.asarray(grades, dtype=np.int64))
+
+    def __add__(self, other):
+        import numpy as np
+
+        histogram = np.zeros(max(len(self.histogram), len(other.histogram)), dtype=np.int64)
+        histogram[:len(self.histogram)] += self.histogram
+        histogram[:len(other.histogram)] += other.histogram
+        return SubjectAggregate(self.count + other.count, self.total + other.total, self.squares + other.squares,
+                                min(self.lowest, other.lowest), max(self.highest, other.highest),
+                                self.distinction + other.distinction, self.centum + other.centum, histogram,
+                                self.grades + other.grades)
+
+    @property
+    def mean(self):
+        return self.total / self.count
+
+    @property
+    def std(self):
+        """Population standard deviation."""
+        return max(self.squares / self.count - self.mean ** 2, 0) ** 0.5
+
+    def band_count(self, lowest, upper):
+        """Students who scored from lowest up to (not including) upper."""
+        return int(self.histogram[lowest:upper].sum())
+
+    def percentile(self, q):
+        """q-th percentile (linear, like numpy/pandas) from the histogram."""
+        import numpy as np
+
+        pos = q / 100 * (self.count - 1)
+        lo, hi = np.searchsorted(self.histogram.cumsum(), [np.floor(pos), np.ceil(pos)], side="right")
+        return round(float(lo + (hi - lo) * (pos - np.floor(pos))), 2)
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.total, "sum_sq": self.squares, "min": self.lowest,
+                "max": self.highest, "distinction": self.distinction, "centum": self.centum,
+                "histogram": self.histogram.tolist(), "grades": self.grades.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        import numpy as np
+
+        # Version 1 files have no grade counts
+        grades = data.get("grades", [0] * len(SUBJECT_GRADES))
+        return cls(data["count"], data["sum"], data["sum_sq"], data["min"], data["max"], data["distinction"],
+                   data["centum"], np.array(data["histogram"], dtype=np.int64), np.array(grades, dtype=np.int64))
+
+
+class ResultAggregate:
+    """Per-subject SubjectAggregates of one or more gazettes of the same grade.
+
+    Built from parsed columns, saved as a small JSON file and combined with
+    `+`; summary() gives the rows of the Summary sheet.
+    """
+
+    FORMAT_VERSION = 2
+    READ_VERSIONS = (1, 2)
+
+    def __init__(self, is_grade12, students=0, subjects=None):
+        self.is_grade12 = is_grade12
+        self.students = students
+        self.subjects = subjects or {}
+
+    @classmethod
+    def from_columns(cls, columns, is_grade12):
+        return cls.by_group(columns, is_grade12)[0]
+
+    @classmethod
+    def by_group(cls, columns, is_grade12, groups=None, n_groups=1):
+        """One aggregate per group index (e.g. Grade 12 stream), all from one histogram pass."""
+        import numpy as np
+
+        if not len(columns):
+            return [cls(is_grade12) for _ in range(n_groups)]
+        used = columns.used_slots()
+        hist = marks_histogram(columns.marks_matrix()[:, used], groups, n_groups)[:, :, :ABSENT_MARK]
+        grades = marks_histogram(columns.grades_matrix()[:, used], groups, n_groups, len(SUBJECT_GRADES))
+        students = np.bincount(groups, minlength=n_groups) if groups is not None else [len(columns)]
+        return [cls(is_grade12, int(students[g]),
+                    {columns.labels[slot]: SubjectAggregate.from_histogram(hist[g, i], grades[g, i])
+                     for i, slot in enumerate(used.tolist()) if hist[g, i].any()})
+                for g in range(n_groups)]
+
+    def __add__(self, other):
+        if self.is_grade12 != other.is_grade12:
+            raise ValueError("cannot combine Grade 10 and Grade 12 aggregates")
+        subjects = dict(self.subjects)
+        for label, agg in other.subjects.items():
+            subjects[label] = subjects[label] + agg if label in subjects else agg
+        return ResultAggregate(self.is_grade12, self.students + other.students, subjects)
+
+    def summary(self):
+        """Per-subject statistics for the Summary sheet, {row label: values}."""
+        subjects = [label for label in SUBJECTS[self.is_grade12].labels if label in self.subjects]
+        if not subjects:
+            return {}
+        aggs = [self.subjects[s] for s in subjects]
+        summary = {
+            "Subject": subjects,
+            "Highest": [a.highest for a in aggs],
+            "Lowest": [a.lowest for a in aggs],
+            "Average": [round(a.mean, 2) for a in aggs],
+            "Distinction (≥75)": [a.distinction for a in aggs],
+            "100 out of 100": [a.centum for a in aggs],
+        }
+        upper = ABSENT_MARK
+        for lowest, label in MARK_BANDS:
+            summary[label] = [a.band_count(lowest, upper) for a in aggs]
+            upper = lowest
+        for q, label in SUMMARY_PERCENTILES:
+            summary[label] = [a.percentile(q) for a in aggs]
+        # Grade distribution, for the grades that occur at all
+        for code, grade in enumerate(SUBJECT_GRADES[1:], start=1):
+            counts = [int(a.grades[code]) for a in aggs]
+            if any(counts):
+                summary[f"Grade {grade}"] = counts
+        return summary
+
+    def save(self, path):
+        data = {"version": self.FORMAT_VERSION, "grade": 12 if self.is_grade12 else 10, "students": self.students,
+                "subjects": {label: agg.to_dict() for label, agg in self.subjects.items()}}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") not in cls.READ_VERSIONS:
+            raise ValueError(f"{path}: unsupported aggregate version {data.get('version')}")
+        subjects = {label: SubjectAggregate.from_dict(agg) for label, agg in data["subjects"].items()}
+        return cls(data["grade"] == 12, data["students"], subjects)
+
+
+def result_aggregates(columns, is_grade12, metrics):
+    """(ResultAggregate of everyone, {stream: ResultAggregate}) from one histogram pass.
+
+    The per-stream aggregates are only built for Grade 12 (metrics from
+    result_metrics); the whole-cohort one is their sum.
+    """
+    if not is_grade12 or not len(columns):
+        return ResultAggregate.from_columns(columns, is_grade12), {}
+    parts = ResultAggregate.by_group(columns, is_grade12, metrics["Stream"], len(STREAM_NAMES))
+    total = parts[0]
+    for part in parts[1:]:
+        total = total + part
+    total.students = len(columns)
+    return total, {name: part for name, part in zip(STREAM_NAMES, parts) if name and part.students}
+
+
+def stream_sections(streams):
+    """Summary sections for write_workbook, one per stream aggregate."""
+    return {f"{name} stream": agg.summary() for name, agg in streams.items()}
+
+
+def build_summary(columns, is_grade12):
+    """Per-subject statistics for the Summary sheet, {row label: values}.
+
+    Everything comes from one histogram of the marks matrix instead of a
+    scan of every column per statistic.
+    """
+    return ResultAggregate.from_columns(columns, is_grade12).summary()
+
+
+def column_values(series):
+    """Plain Python values of a column, with missing entries as None."""
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def write_sheet(wb, title, df, progress=None):
+    """Append a header row and all rows of df to a new write-only sheet."""
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+
+    ws = wb.create_sheet(title=title)
+    if not len(df.columns):
+        return
+    header = []
+    for col in df.columns:
+        cell = WriteOnlyCell(ws, value=col)
+        cell.font = Font(bold=True)
+        cell.border = Border(*(Side(style="thin"),) * 4)
+        cell.alignment = Alignment(horizontal="center", vertical="top")
+        header.append(cell)
+    ws.append(header)
+    try:
+        for i, row in enumerate(zip(*(column_values(df[col]) for col in df.columns)), start=1):
+            ws.append(row)
+            if i % PROGRESS_ROWS == 0:
+                report(progress, "written", i, len(df))
+        report(progress, "written", len(df), len(df))
+    except Cancelled:
+        ws.close()  # finish the temporary sheet file cleanly
+        raise
+
+
+def write_summary_sheet(wb, summary, sections=None):
+    """Add the Summary sheet (one bold-labelled row per statistic) if there is anything to show.
+
+    sections ({title: summary}) follow the main block, each after a blank
+    row and a bold title row (e.g. one per Grade 12 stream).
+    """
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    def bold(value):
+        cell = WriteOnlyCell(ws_summary, value=value)
+        cell.font = Font(bold=True)
+        return cell
+
+    # ✅ Summary Sheet
+    if summary:
+        ws_summary = wb.create_sheet(title="Summary")
+        ws_summary.append([])
+        for label, values in summary.items():
+            ws_summary.append([bold(label), *values])
+        for title, rows in (sections or {}).items():
+            if rows:
+                ws_summary.append([])
+                ws_summary.append([bold(title)])
+                for label, values in rows.items():
+                    ws_summary.append([bold(label), *values])
+
+
+def write_workbook(df, filename, progress=None, extra_sheets=None, summary=None, sections=None):
+    """Write the result sheet and the Summary sheet in one streaming pass.
+
+    Uses a write-only workbook, so rows go straight to disk and the file
+    is never loaded back. Nothing is written if `progress` cancels.
+    summary comes from build_summary, sections are extra Summary blocks
+    (see write_summary_sheet); extra_sheets ({title: DataFrame}) are added
+    after the Summary sheet.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    write_sheet(wb, "Sheet1", df, progress)
+    write_summary_sheet(wb, summary, sections)
+
+    for title, sheet_df in (extra_sheets or {}).items():
+        write_sheet(wb, title, sheet_df)
+
+    wb.save(filename)
+
+
+# -------------------------
+# Other output formats
+# -------------------------
+# Columns stored dictionary-encoded in Parquet (few distinct values each)
+DICTIONARY_COLUMNS = SUBJECT_LABELS | {grade_col_for(label) for label in SUBJECT_LABELS} | {"Gender", "Result", "Stream"}
+
+
+def write_csv(df, filename, progress=None):
+    """Stream df to a CSV file, PROGRESS_ROWS rows at a time.
+
+    Rows go to a .part file that replaces filename only when complete,
+    so nothing is left behind if `progress` cancels.
+    """
+    part = filename + ".part"
+    try:
+        with open(part, "w", encoding="utf-8", newline="") as f:
+            for start in range(0, max(len(df), 1), PROGRESS_ROWS):
+                df.iloc[start:start + PROGRESS_ROWS].to_csv(f, header=start == 0, index=False)
+                report(progress, "written", min(start + PROGRESS_ROWS, len(df)), len(df))
+        os.replace(part, filename)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+
+def arrow_table(df):
+    """df as a pyarrow Table; pyarrow is only needed for Parquet/Feather output."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Parquet and Feather output need the pyarrow package (pip install pyarrow).") from None
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def write_parquet(df, filename, progress=None):
+    """Write df as Parquet with dictionary-encoded subject and code columns."""
+    table = arrow_table(df)
+    import pyarrow.parquet as pq
+
+    pq.write_table(table, filename, compression="zstd",
+                   use_dictionary=[col for col in df.columns if col in DICTIONARY_COLUMNS])
+    report(progress, "written", len(df), len(df))
+
+
+def write_feather(df, filename, progress=None):
+    """Write df as an Arrow IPC (Feather v2) file."""
+    table = arrow_table(df)
+    import pyarrow.feather as feather
+
+    feather.write_feather(table, filename)
+    report(progress, "written", len(df), len(df))
+
+
+# extension -> (format name, writer); .xlsx goes through write_workbook
+OUTPUT_FORMATS = {
+    ".xlsx": ("Excel", None),
+    ".csv": ("CSV", write_csv),
+    ".parquet": ("Parquet", write_parquet),
+    ".feather": ("Feather", write_feather),
+    ".arrow": ("Arrow", write_feather),
+}
+
+
+def output_format(filename):
+    """Format name for filename's extension; ValueError for an unknown one."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output file type '{ext}'. Use one of: {', '.join(OUTPUT_FORMATS)}")
+    return OUTPUT_FORMATS[ext][0]
+
+
+def write_output(df, filename, progress=None, extra_sheets=None, summary=None, sections=None):
+    """Write df in the format given by filename's extension (see OUTPUT_FORMATS).
+
+    .xlsx gets the Summary sheet and extra sheets as in write_workbook.
+    The other formats hold the result table only; each extra sheet goes
+    to its own "<name>-<title><ext>" file next to it.
+    """
+    output_format(filename)
+    stem, ext = os.path.splitext(filename)
+    writer = OUTPUT_FORMATS[ext.lower()][1]
+    if writer is None:
+        return write_workbook(df, filename, progress, extra_sheets, summary, sections)
+    writer(df, filename, progress)
+    for title, sheet_df in (extra_sheets or {}).items():
+        writer(sheet_df, f"{stem}-{title}{ext}")
+
+
+# -------------------------
+# Pipeline
+# -------------------------
+def warm_imports():
+    """Import the heavy libraries ahead of the first export (safe from a background thread)."""
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import openpyxl  # noqa: F401
+
+
+def default_workers(path):
+    """Use every core for large files, a single process otherwise."""
+    return os.cpu_count() if os.path.getsize(path) >= PARALLEL_MIN_BYTES else 1
+
+
+def load_gazette(path, is_grade12, workers=None, reader="mmap", progress=None, cache=None, start=0):
+    """parse_gazette with automatic worker count and optional result_cache.ParseCache."""
+    if workers is None:
+        workers = default_workers(path)
+    if cache is not None:
+        return cache.parse(path, is_grade12, workers, reader, progress, start)
+    return parse_gazette(path, is_grade12, workers, reader, progress, start)
+
+
+def convert_gazette(path, is_grade12, filename, workers=None, reader="mmap", progress=None, cache=None,
+                    snapshot=None, aggregate=None, start=0, database=None, school=None, year=None,
+                    grade_columns=False):
+    """Parse a gazette TXT file and write the result workbook. Returns the DataFrame.
+
+    The output format follows filename's extension (see write_output).
+    With a result_cache.ParseCache, a file that was parsed before is not
+    parsed again. snapshot is an optional .npz path for save_snapshot,
+    aggregate an optional .json path for the file's ResultAggregate.
+    start is where parsing begins (FirstRecord.offset from sniff_first_record).
+    database is an optional SQLite file the results are also loaded into
+    (see result_store; school/year default to the gazette's header).
+    grade_columns adds a grade column after every subject column.
+    Records that did not line up are listed on an "Issues" sheet; their
+    count is in the returned DataFrame's attrs["issues"].
+    """
+    output_format(filename)  # fail before parsing, not after
+    columns = load_gazette(path, is_grade12, workers, reader, progress, cache, start)
+    return export_columns(columns, is_grade12, path, filename, progress, snapshot, aggregate, database, school, year,
+                          grade_columns)
+
+
+def export_columns(columns, is_grade12, path, filename, progress=None, snapshot=None, aggregate=None, database=None,
+                   school=None, year=None, grade_columns=False):
+    """The part of convert_gazette after parsing: `columns` (parsed from path) to filename.
+
+    Returns the DataFrame, with the issue count in attrs["issues"].
+    """
+    metrics = result_metrics(columns, is_grade12)
+    if snapshot:
+        save_snapshot(snapshot, columns, metrics)
+    if database:
+        from result_store import save_to_database
+
+        save_to_database(database, columns, is_grade12, path, school, year)
+    stats, streams = result_aggregates(columns, is_grade12, metrics)
+    if aggregate:
+        stats.save(aggregate)
+    df = build_result_frame(columns, is_grade12, metrics, grade_columns)
+    write_output(df, filename, progress, extra_sheets=issue_sheets(columns), summary=stats.summary(),
+                 sections=stream_sections(streams))
+    df.attrs["issues"] = len(columns.issues)
+    return df
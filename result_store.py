@@ -0,0 +1,143 @@
+"""SQLite store of parsed results, for queries across schools and years.
+
+One row per gazette, per student and per mark:
+
+    gazettes(id, school, year, grade, source, digest)
+    students(id, gazette_id, roll, gender, name, result, stream)
+    subjects(code, label)
+    marks(student_id, subject_code, mark, grade)
+
+so "show roll 12345678" or "everyone below 33 in MAT-041 since 2020" is a
+single indexed query instead of opening workbooks. Loading a gazette
+again (same contents, grade and school) replaces its earlier rows.
+"""
+import os
+import re
+import sqlite3
+
+import result_core as core
+from result_cache import file_digest
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gazettes (
+    id INTEGER PRIMARY KEY,
+    school TEXT NOT NULL,
+    year INTEGER,
+    grade INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    UNIQUE (digest, grade, school)
+);
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    gazette_id INTEGER NOT NULL REFERENCES gazettes (id),
+    roll INTEGER NOT NULL,
+    gender TEXT NOT NULL,
+    name TEXT NOT NULL,
+    result TEXT NOT NULL,
+    stream TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subjects (
+    code TEXT PRIMARY KEY,
+    label TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS marks (
+    student_id INTEGER NOT NULL REFERENCES students (id),
+    subject_code TEXT NOT NULL REFERENCES subjects (code),
+    mark INTEGER NOT NULL,
+    grade TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (student_id, subject_code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS gazettes_school_year ON gazettes (school, year);
+CREATE INDEX IF NOT EXISTS gazettes_year ON gazettes (year);
+CREATE INDEX IF NOT EXISTS students_roll ON students (roll);
+CREATE INDEX IF NOT EXISTS students_gazette ON students (gazette_id);
+CREATE INDEX IF NOT EXISTS marks_subject_mark ON marks (subject_code, mark);
+"""
+
+# Gazette preamble lines such as "SCHOOL : 12345" and "RESULT GAZETTE 2025"
+SCHOOL_RE = re.compile(r"SCHOOL\s*:\s*-?\s*(\d{5})", re.I)
+YEAR_RE = re.compile(r"\b(20\d{2})\b")
+
+
+def gazette_info(path, first_offset=None):
+    """(school, year) from the gazette preamble, else (file name, None)."""
+    if first_offset is None:
+        first = core.sniff_first_record(path)
+        first_offset = first.offset if first else core.SNIFF_BYTES
+    with open(path, "rb") as f:
+        preamble = f.read(min(first_offset, core.SNIFF_BYTES)).decode("utf-8", errors="ignore")
+    school = SCHOOL_RE.search(preamble)
+    year = YEAR_RE.search(preamble)
+    return (school.group(1) if school else os.path.splitext(os.path.basename(path))[0],
+            int(year.group(1)) if year else None)
+
+
+def open_store(path):
+    """Open (and create if needed) the results database at path."""
+    conn = sqlite3.connect(path, timeout=60)  # parallel exports wait for each other's transaction
+    conn.execute("PRAGMA journal_mode = WAL")  # readers are not blocked while a gazette loads
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(SCHEMA)
+    # Databases created before grades were kept
+    if "grade" not in [row[1] for row in conn.execute("PRAGMA table_info(marks)")]:
+        conn.execute("ALTER TABLE marks ADD COLUMN grade TEXT NOT NULL DEFAULT ''")
+    return conn
+
+
+def store_results(conn, columns, is_grade12, source, school=None, year=None):
+    """Insert one parsed gazette in a single transaction; returns its gazette id.
+
+    school/year default to gazette_info(source). Rows from an earlier load
+    of the same gazette are deleted first.
+    """
+    import numpy as np
+
+    info = gazette_info(source)
+    school = school or info[0]
+    year = year or info[1]
+    grade = 12 if is_grade12 else 10
+    registry = core.SUBJECTS[is_grade12]
+    data = columns.to_columns()
+    matrix = columns.marks_matrix()
+    taken = matrix != core.ABSENT_MARK
+    streams = core.student_streams(taken) if is_grade12 else np.zeros(len(columns), dtype=np.uint8)
+
+    with conn:
+        digest = file_digest(source)
+        old = conn.execute("SELECT id FROM gazettes WHERE digest = ? AND grade = ? AND school = ?",
+                           (digest, grade, school)).fetchone()
+        if old:
+            conn.execute("DELETE FROM marks WHERE student_id IN (SELECT id FROM students WHERE gazette_id = ?)", old)
+            conn.execute("DELETE FROM students WHERE gazette_id = ?", old)
+            conn.execute("DELETE FROM gazettes WHERE id = ?", old)
+        gazette_id = conn.execute(
+            "INSERT INTO gazettes (school, year, grade, source, digest) VALUES (?, ?, ?, ?, ?)",
+            (school, year, grade, os.path.basename(source), digest)).lastrowid
+        conn.executemany("INSERT OR IGNORE INTO subjects (code, label) VALUES (?, ?)",
+                         zip(registry.codes, registry.labels))
+
+        first_id = (conn.execute("SELECT MAX(id) FROM students").fetchone()[0] or 0) + 1
+        ids = np.arange(first_id, first_id + len(columns))
+        stream_names = [core.STREAM_NAMES[code] for code in streams.tolist()]
+        conn.executemany(
+            "INSERT INTO students (id, gazette_id, roll, gender, name, result, stream) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip(ids.tolist(), [gazette_id] * len(columns), columns.rolls, data["Gender"].tolist(), data["Name"],
+                data["Result"].astype(str).tolist(), stream_names))
+
+        rows, slots = np.nonzero(taken)
+        codes = np.array(registry.codes, dtype=object)
+        grades = np.array(core.SUBJECT_GRADES, dtype=object)[columns.grades_matrix()[rows, slots]]
+        conn.executemany("INSERT INTO marks (student_id, subject_code, mark, grade) VALUES (?, ?, ?, ?)",
+                         zip(ids[rows].tolist(), codes[slots].tolist(), matrix[rows, slots].tolist(),
+                             grades.tolist()))
+    return gazette_id
+
+
+def save_to_database(path, columns, is_grade12, source, school=None, year=None):
+    """open_store + store_results + close, for one-off exports."""
+    conn = open_store(path)
+    try:
+        return store_results(conn, columns, is_grade12, source, school, year)
+    finally:
+        conn.close()
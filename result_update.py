@@ -0,0 +1,160 @@
+"""Apply a supplementary (compartment) gazette to an earlier result snapshot.
+
+Only the students whose marks or result changed (or who are new) get
+their totals recomputed, and the dense ranks are shifted instead of
+re-ranking the whole cohort. The workbook gets an extra "Changed" sheet
+listing those students.
+"""
+import result_core as core
+
+# Above this many changed distinct values a full re-rank is cheaper
+MAX_INCREMENTAL_VALUES = 64
+
+
+def update_dense_rank(before, after, ranks, touched):
+    """Dense ranks (highest first) of `after`, given `ranks` of `before`.
+
+    Only the rows in `touched` changed value; rows past len(before) are new
+    students and must be in `touched`. Untouched rows keep their rank
+    except for a shift by the distinct values that appeared or vanished
+    above them.
+    """
+    import numpy as np
+
+    n_old = len(before)
+    untouched = np.ones(len(after), dtype=bool)
+    untouched[touched] = False
+
+    old_vals = np.unique(before[touched[touched < n_old]])
+    new_vals = np.unique(after[touched])
+    if len(old_vals) + len(new_vals) > MAX_INCREMENTAL_VALUES:
+        return core.dense_rank(after)
+
+    removed = np.array([v for v in old_vals if not (after == v).any()], dtype=after.dtype)
+    added = np.array([v for v in new_vals if not (before == v).any()], dtype=after.dtype)
+
+    result = np.zeros(len(after), dtype=np.int64)
+    result[:n_old] = ranks
+    if len(added) or len(removed):
+        # rank = 1 + distinct values above, so shift by the ones added/removed above
+        result += len(added) - np.searchsorted(added, after, side="right")
+        result -= len(removed) - np.searchsorted(removed, after, side="right")
+
+    kept = after[untouched]
+    kept_ranks = result[untouched]
+    for value in new_vals:
+        same = kept == value
+        if same.any():
+            rank = kept_ranks[same][0]
+        else:
+            above = kept > value
+            if above.any():
+                nearest = kept[above].min()
+                # Only touched values can lie between value and the nearest untouched one
+                between = ((new_vals > value) & (new_vals < nearest)).sum()
+                rank = kept_ranks[kept == nearest][0] + 1 + between
+            else:
+                rank = 1 + (new_vals > value).sum()
+        result[touched[after[touched] == value]] = rank
+    return result
+
+
+def apply_update(columns, metrics, update, is_grade12):
+    """Merge the students of `update` into `columns`/`metrics` in place.
+
+    Students are matched by roll number: changed ones are overwritten,
+    unknown ones appended. Returns (touched row indices, previous result
+    of each touched row, "" for new students).
+    """
+    import numpy as np
+
+    n_old = len(columns)
+    width = len(columns.labels)
+    rolls = np.array(columns.rolls, dtype=np.int64)
+    new_rolls = np.array(update.rolls, dtype=np.int64)
+
+    order = np.argsort(rolls, kind="stable")
+    pos = np.minimum(np.searchsorted(rolls, new_rolls, sorter=order), max(n_old - 1, 0))
+    target = order[pos] if n_old else np.zeros(len(new_rolls), dtype=np.int64)
+    found = (rolls[target] == new_rolls) if n_old else np.zeros(len(new_rolls), dtype=bool)
+
+    old_marks = columns.marks_matrix()
+    new_marks = update.marks_matrix()
+    old_grades = columns.grades_matrix()
+    new_grades = update.grades_matrix()
+    old_results = np.frombuffer(columns.results, dtype=np.uint8)
+    new_results = np.frombuffer(update.results, dtype=np.uint8)
+
+    src = np.nonzero(found)[0]
+    dst = target[found]
+    differs = ((old_marks[dst] != new_marks[src]).any(axis=1) | (old_grades[dst] != new_grades[src]).any(axis=1) |
+               (old_results[dst] != new_results[src]))
+    src, dst = src[differs], dst[differs]
+    previous = [core.RESULT_CODES[code] for code in old_results[dst]]
+
+    # Overwrite changed students (views are released before the buffers grow)
+    old_marks[dst] = new_marks[src]
+    old_grades[dst] = new_grades[src]
+    changed_results = new_results[src]
+    del old_marks, new_marks, old_grades, new_grades, old_results, new_results
+    for i, j in zip(dst.tolist(), src.tolist()):
+        columns.genders[i] = update.genders[j]
+        columns.names[i] = update.names[j]
+    for i, code in zip(dst.tolist(), changed_results.tolist()):
+        columns.results[i] = code
+
+    # Append new students
+    for j in np.nonzero(~found)[0].tolist():
+        columns.rolls.append(update.rolls[j])
+        columns.genders.append(update.genders[j])
+        columns.names.append(update.names[j])
+        columns.results.append(update.results[j])
+        columns.marks += update.marks[j * width:(j + 1) * width]
+        columns.grades += update.grades[j * width:(j + 1) * width]
+        previous.append("")
+
+    touched = np.concatenate([dst, np.arange(n_old, len(columns))]).astype(np.int64)
+
+    # Totals only for the touched rows, then shift the ranks
+    fresh = core.compute_metrics(columns.marks_matrix()[touched], is_grade12)
+    before = {}
+    for name, values in fresh.items():
+        before[name] = metrics[name]
+        grown = np.resize(metrics[name], len(columns)).astype(np.result_type(metrics[name], values))
+        grown[touched] = values
+        metrics[name] = grown
+    for metric, rank in core.RANKED_METRICS[is_grade12]:
+        metrics[rank] = update_dense_rank(before[metric], metrics[metric], metrics[rank], touched)
+    # Stream ranks come from one grouped sort, cheap enough to redo
+    core.stream_ranks(metrics, is_grade12)
+    return touched, previous
+
+
+def update_gazette(snapshot, path, is_grade12, filename, snapshot_out=None, workers=None, cache=None,
+                   aggregate=None, grade_columns=False):
+    """Apply the gazette at `path` to `snapshot` and write the updated workbook.
+
+    The workbook has the full updated result sheet, the Summary sheet and
+    a "Changed" sheet with the touched students and their previous result
+    (a separate "<name>-Changed" file for the non-Excel formats), plus an
+    "Issues" sheet for records of the supplementary gazette that did not line up.
+    aggregate is an optional .json path for the updated ResultAggregate.
+    Returns (full DataFrame, changed DataFrame).
+    """
+    columns, metrics = core.load_snapshot(snapshot, is_grade12)
+    update = core.load_gazette(path, is_grade12, workers, cache=cache)
+    touched, previous = apply_update(columns, metrics, update, is_grade12)
+    if snapshot_out:
+        core.save_snapshot(snapshot_out, columns, metrics)
+
+    stats, streams = core.result_aggregates(columns, is_grade12, metrics)
+    if aggregate:
+        stats.save(aggregate)
+    df = core.build_result_frame(columns, is_grade12, metrics, grade_columns)
+    changed = df.iloc[touched].copy() if len(df) else df.copy()
+    if len(df):
+        changed.insert(changed.columns.get_loc("Result"), "Previous Result", previous)
+    core.write_output(df, filename, extra_sheets={"Changed": changed, **core.issue_sheets(update)},
+                      summary=stats.summary(),
+                      sections=core.stream_sections(streams))
+    return df, changed